@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Batch processing of many calculation directories with the same options,
+shared by pyband, pydos and npdos.
+'''
+
+from __future__ import print_function, division
+
+import os
+import sys
+import copy
+import glob
+import time
+import multiprocessing
+
+############################################################
+# The per-item function and options of the batch, set in each worker
+_BATCH_TASK = None
+############################################################
+
+
+def expand_dirs(paths):
+    '''
+    Expand the glob patterns in "paths", "-" stands for the directories read
+    from the standard input, one per line. The directories are returned as
+    absolute paths, patterns without any match are kept, so that they are
+    reported as missing.
+    '''
+    dirs = []
+    for path in paths:
+        if path == '-':
+            names = [x.strip() for x in sys.stdin if x.strip()]
+        else:
+            names = sorted(glob.glob(path)) or [path]
+        dirs += [os.path.abspath(name) for name in names]
+
+    return dirs
+
+
+def init_worker(func, opts, plot=True):
+    '''
+    Initialize a worker of the batch. If "plot" is True, matplotlib is
+    imported with the Agg backend and its font cache is loaded once, the
+    imports, fonts and styles are then reused by all the items of the worker.
+    '''
+    global _BATCH_TASK
+    _BATCH_TASK = (func, opts)
+
+    if plot:
+        # a failure here would kill the worker, it is reported by the items
+        try:
+            import matplotlib as mpl
+            mpl.use('agg')
+            import matplotlib.pyplot as plt
+            from matplotlib import font_manager
+            font_manager.findfont(font_manager.FontProperties(
+                family=mpl.rcParams['font.family']))
+        except Exception:
+            pass
+
+
+def run_item(dname):
+    '''
+    Run the function of the batch in the directory "dname" with a copy of the
+    options, so that the relative file names of the options are those in the
+    directory. The output of the function is discarded and the figures are
+    closed afterwards.
+
+    Returns "(dname, pid, time, error)", where "error" is None on success.
+    '''
+    func, opts = _BATCH_TASK
+    cwd = os.getcwd()
+    stdout = sys.stdout
+    t0 = time.time()
+    error = None
+    try:
+        os.chdir(dname)
+        sys.stdout = open(os.devnull, 'w')
+        func(copy.deepcopy(opts))
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+        os.chdir(cwd)
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
+
+    return dname, os.getpid(), time.time() - t0, error
+
+
+def split_jobs(jobs, batch_jobs=None, ndirs=None):
+    '''
+    The number of processes of the batch and that of the processes parsing
+    PROCAR in each item, from the options "-j" ("jobs") and the batch jobs.
+    Without the latter, "-j" is the number of processes of the batch. The
+    items of a pool of more than one process are run in daemonic workers,
+    which cannot start processes, so PROCAR is then parsed by one process
+    and the processes are never nested.
+    '''
+    if batch_jobs is None:
+        batch_jobs, jobs = jobs, 1
+    if batch_jobs is None or batch_jobs <= 0:
+        batch_jobs = multiprocessing.cpu_count()
+    if ndirs is not None:
+        batch_jobs = max(1, min(batch_jobs, ndirs))
+    if batch_jobs > 1:
+        jobs = 1
+
+    return batch_jobs, jobs
+
+
+def run_batch(func, opts, dirs, jobs=1, plot=True):
+    '''
+    Call "func(opts)" in each of the directories "dirs", in a pool of "jobs"
+    processes, 0 for all the CPUs. "plot" tells whether "func" creates
+    figures, see "init_worker". The time used by each item and the worker
+    are printed as the items are finished, the failed items are reported to
+    the standard error and skipped.
+
+    Returns the number of failed items.
+    '''
+    if jobs is None or jobs <= 0:
+        jobs = multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(dirs)))
+
+    t0 = time.time()
+    if jobs == 1:
+        init_worker(func, opts, plot)
+        results = (run_item(dname) for dname in dirs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, initializer=init_worker,
+                                    initargs=(func, opts, plot))
+        results = pool.imap_unordered(run_item, dirs)
+
+    nfail = 0
+    try:
+        for dname, pid, dt, error in results:
+            if error is None:
+                print('[%6d] %s: %.2f [sec]' % (pid, dname, dt))
+            else:
+                nfail += 1
+                print('[%6d] %s: skipped, %s' % (pid, dname, error),
+                      file=sys.stderr)
+            sys.stdout.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print('%d of %d items completed! Time Used: %.2f [sec]' % (
+        len(dirs) - nfail, len(dirs), time.time() - t0))
+
+    return nfail
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Throughput of building adsorption models, in structures per second.
+
+The same model, a supercell of a bulk cut into a slab with the bottom layer
+fixed, a molecule adsorbed and an atom deleted, is built from "-m" copies of
+the bulk POSCAR, either by running xcell.py, kut.py, molAdd.py and molDel.py
+one after another for each copy, or by one run of xpipe.py over all of them.
+The outputs of both are checked to be the same. Without "-i", the bulk is
+rock-salt NaCl built by ASE.
+
+Usage:
+    python benchmarks/pipeline.py [-m 20] [-i POSCAR] [-s 2 2 1]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(cmd, cwd):
+    '''
+    Run the tool "cmd" in "cwd".
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in [env.get('PYTHONPATH')] if x]
+    )
+    p = subprocess.run([sys.executable, os.path.join(ROOT, cmd[0])] + cmd[1:],
+                       cwd=cwd, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise RuntimeError('"%s" failed:\n%s' % (
+            ' '.join(cmd), p.stderr.decode(errors='replace')[-2000:]))
+
+
+def same_structure(a, b, tol=1E-4):
+    '''
+    Whether "a" and "b" have the same cell and atoms, up to lattice
+    translations of the atoms. The atoms at the cell boundary may be wrapped
+    differently by the scripts, due to the rounding of the intermediate files,
+    and then sorted differently.
+    '''
+    if len(a) != len(b) or not np.allclose(a.cell[:], b.cell[:], atol=tol):
+        return False
+    diff = a.get_scaled_positions()[:, None, :] - b.get_scaled_positions()[None, :, :]
+    diff -= np.rint(diff)
+    dist = np.linalg.norm(np.dot(diff, a.cell[:]), axis=-1)
+    dist[a.numbers[:, None] != b.numbers[None, :]] = np.inf
+
+    return bool(np.all(dist.min(axis=1) < tol) and np.all(dist.min(axis=0) < tol))
+
+
+def parse_cml_args(cml):
+    '''
+    CML parser.
+    '''
+    arg = argparse.ArgumentParser(add_help=True)
+
+    arg.add_argument('-m', dest='ncopy', action='store', type=int,
+                     default=20,
+                     help='Number of structures built')
+    arg.add_argument('-i', dest='poscar', action='store', type=str,
+                     default=None,
+                     help='The bulk POSCAR, default to NaCl')
+    arg.add_argument('-s', dest='size', action='store', type=int,
+                     default=[2, 2, 1], nargs=3,
+                     help='Supercell size')
+    arg.add_argument('--hkl', dest='hkl', action='store', type=int,
+                     default=[1, 0, 0], nargs=3,
+                     help='Surface of the slab')
+    arg.add_argument('-n', dest='nlayer', action='store', type=int,
+                     default=3,
+                     help='Number of layers of the slab')
+
+    return arg.parse_args(cml)
+
+
+def main(cml):
+    arg = parse_cml_args(cml)
+    from ase.io import read
+
+    wdir = tempfile.mkdtemp(prefix='pipeline-')
+    try:
+        if arg.poscar:
+            shutil.copy(arg.poscar, os.path.join(wdir, 'bulk.vasp'))
+        else:
+            from ase.build import bulk
+            bulk('NaCl', 'rocksalt', 5.64).write(
+                os.path.join(wdir, 'bulk.vasp'), format='vasp')
+
+        dirs = []
+        for ii in range(arg.ncopy):
+            dname = os.path.join(wdir, '%04d' % ii)
+            os.mkdir(dname)
+            shutil.copy(os.path.join(wdir, 'bulk.vasp'),
+                        os.path.join(dname, 'POSCAR'))
+            dirs.append(dname)
+
+        size = [str(x) for x in arg.size]
+        hkl = [str(x) for x in arg.hkl]
+        nlayer = str(arg.nlayer)
+
+        t0 = time()
+        for dname in dirs:
+            run(['xcell.py', '-s'] + size + ['-o', 'sc.vasp'], dname)
+            run(['kut.py', '-i', 'sc.vasp', '--hkl'] + hkl +
+                ['-n', nlayer, '-f', '0', '-o', 'slab.vasp'], dname)
+            run(['molAdd.py', '-i', 'slab.vasp', '-m', 'H2O', '-a', '0',
+                 '--height', '2.0', '-o', 'ads.vasp'], dname)
+            run(['molDel.py', '-i', 'ads.vasp', '-a', '2',
+                 '-o', 'chain.vasp'], dname)
+        t_chain = time() - t0
+
+        t0 = time()
+        run(['xpipe.py', '-i'] + [os.path.join(d, 'POSCAR') for d in dirs] +
+            ['--supercell'] + size + ['--cut'] + hkl + [nlayer] +
+            ['--fix', '0', '--vacuum', '15', '--add', 'H2O', '0', '2.0',
+             '--delete', '2', '-o', 'pipe.vasp'], wdir)
+        t_pipe = time() - t0
+
+        for dname in dirs:
+            assert same_structure(read(os.path.join(dname, 'chain.vasp')),
+                                  read(os.path.join(dname, 'pipe.vasp')))
+
+        print('%-40s %9s %14s' % ('# method', 'time[s]', 'structures/s'))
+        for name, t in [('xcell/kut/molAdd/molDel processes', t_chain),
+                        ('xpipe.py in-process', t_pipe)]:
+            print('%-40s %9.3f %14.2f' % (name, t, arg.ncopy / t))
+    finally:
+        shutil.rmtree(wdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
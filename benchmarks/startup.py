@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Startup time of the command line tools.
+
+Each command is run several times in a fresh interpreter and the best and the
+median wall time are reported, together with the heavy packages, i.e.
+matplotlib and ASE, imported by the command. Without "-d", only the "-h"
+commands are timed. With "-d DIR", where DIR contains OUTCAR, PROCAR and
+optionally KPOINTS and POSCAR, the data-only and the plotting runs of pyband,
+pydos and npdos are also timed. They are run in a temporary directory with
+symbolic links to the files, so that DIR is not modified.
+
+Usage:
+    python benchmarks/startup.py [-n 5] [-d path/to/vasp/run]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_PACKAGES = ['matplotlib', 'ase']
+
+HELP_COMMANDS = [
+    ['pyband', '-h'],
+    ['pydos', '-h'],
+    ['npband', '-h'],
+    ['npdos', '-h'],
+    ['pygap', '-h'],
+    ['xcell.py', '-h'],
+    ['kut.py', '-h'],
+    ['plot_workfunc.py', '-h'],
+]
+
+DATA_COMMANDS = [
+    ['pygap'],
+    ['pyband', '--noplot', '--occ', '1'],
+    ['pyband', '-q', '--occ', '1'],
+    ['pydos', '--noplot', '-p', '1', '--tofile', 'dos.dat'],
+    ['pydos', '-q', '-p', '1', '--tofile', 'dos.dat'],
+    ['pydos', '--noplot', '--fromfile', 'dos.dat', '--tofile', 'dos.npz'],
+    ['npdos', '-noplot', '-p', '1', '-tofile', 'npdos.dat'],
+    ['npdos', '-q', '-p', '1'],
+]
+
+
+def run(cmd, cwd, nrep):
+    '''
+    Run the tool "cmd" "nrep" times in "cwd", returns the wall times and the
+    heavy packages imported in the last run.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in [env.get('PYTHONPATH')] if x]
+    )
+    args = [sys.executable, '-X', 'importtime',
+            os.path.join(ROOT, cmd[0])] + cmd[1:]
+
+    timing = []
+    for ii in range(nrep):
+        t0 = time()
+        p = subprocess.run(args, cwd=cwd, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timing.append(time() - t0)
+        if p.returncode != 0:
+            raise RuntimeError('"%s" failed:\n%s' % (
+                ' '.join(cmd), p.stderr.decode(errors='replace')[-2000:]))
+
+    # the lines of "-X importtime" are "import time: self | cumulative | name"
+    imported = set()
+    for line in p.stderr.decode(errors='replace').splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            name = line.split('|')[-1].strip()
+            imported.add(name.split('.')[0])
+
+    return timing, [x for x in HEAVY_PACKAGES if x in imported]
+
+
+def parse_cml_args(cml):
+    '''
+    CML parser.
+    '''
+    arg = argparse.ArgumentParser(add_help=True)
+
+    arg.add_argument('-n', dest='nrep', action='store', type=int,
+                     default=5,
+                     help='Number of runs of each command')
+    arg.add_argument('-d', dest='vaspdir', action='store', type=str,
+                     default=None,
+                     help='Directory containing OUTCAR and PROCAR')
+
+    return arg.parse_args(cml)
+
+
+def main(cml):
+    arg = parse_cml_args(cml)
+
+    wdir = tempfile.mkdtemp(prefix='startup-')
+    try:
+        commands = list(HELP_COMMANDS)
+        if arg.vaspdir:
+            for fname in ['OUTCAR', 'PROCAR', 'KPOINTS', 'POSCAR']:
+                src = os.path.abspath(os.path.join(arg.vaspdir, fname))
+                if os.path.isfile(src):
+                    os.symlink(src, os.path.join(wdir, fname))
+            commands += DATA_COMMANDS
+
+        print('%-60s %9s %9s  %s' % ('# command', 'best[s]', 'median[s]',
+                                      'heavy imports'))
+        for cmd in commands:
+            timing, heavy = run(cmd, wdir, arg.nrep)
+            print('%-60s %9.3f %9.3f  %s' % (
+                ' '.join(cmd), np.min(timing), np.median(timing),
+                ' '.join(heavy) if heavy else '-'))
+    finally:
+        shutil.rmtree(wdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
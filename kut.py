@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import sys, argparse
+from itertools import product
 import numpy as np
-from ase.atoms import Atoms
-from ase.build import surface
-from ase.io import read, write
-from ase.constraints import FixAtoms
+from structops import (find_natoms_layers, sort_atoms, symbol_order,
+                       symmetry_operations, write_poscar)
 
 def parse_cml_args(cml):
     '''
@@ -19,80 +19,95 @@ def parse_cml_args(cml):
                      help='The primitive cell base on which to cut the slab.')
     arg.add_argument('-o', dest='out', action='store', type=str,
                      default=None,
-                     help='Default output filename.')
+                     help='Default output filename. The output directory if several slabs are generated.')
     arg.add_argument('--hkl', dest='hkl', action='store', type=int,
-                     default=[1, 1, 1], nargs=3,
-                     help='Surface normal in Miller indices (h,k,l).')
+                     default=[1, 1, 1], nargs='+',
+                     help='Surface normal in Miller indices (h,k,l). Several surfaces by "--hkl 1 1 1 1 0 0".')
     arg.add_argument('-n', dest='nlayer', action='store', type=int,
-                     default=3,
-                     help='Number of layers of the slab.')
+                     default=[3], nargs='+',
+                     help='Number of layers of the slab, several values are allowed.')
     arg.add_argument('-l', dest='layer_thickness', action='store', type=float,
                      default=0.1,
                      help='Default thickness of each atomic layer.')
     arg.add_argument('-s', dest='new_sym_order', action='store',
                      type=str, default=None, nargs='*',
                      help='New order of the chemical symbols.')
-    arg.add_argument('-d', dest='delete_atomic_layer', action='store',
+    arg.add_argument('-d', dest='delete_atomic_layer', action='append',
                      type=int, default=None, nargs='*',
-                     help='Delete the unwanted atomic layer.')
-    arg.add_argument('-f', dest='fix_atomic_layers', action='store',
+                     help='Delete the unwanted atomic layer. Repeat the option for several slabs, e.g. "-d -d 0" for slabs without and with the first layer.')
+    arg.add_argument('-f', dest='fix_atomic_layers', action='append',
                      type=int, default=None, nargs='*',
-                     help='Fix the atoms in the specified atomic layers.')
+                     help='Fix the atoms in the specified atomic layers. Repeat the option for several slabs.')
     arg.add_argument('-v', '--vacuum', dest='vacuum', action='store', type=float,
-                     default=15., 
+                     default=15.,
                      help='Set new vacuum length.')
     arg.add_argument('--ivacuum', dest='ivacuum', action='store', type=str,
                      default='z', choices=['x', 'y', 'z'],
                      help='Vacuum direction.')
-
-    return arg.parse_args(cml)
-
-def find_natoms_layers(pos_z, layer_thickness):
+    arg.add_argument('--symprec', dest='symprec', action='store', type=float,
+                     default=1E-3,
+                     help='Tolerance in Angstrom of the symmetry of the bulk, the surfaces equivalent by symmetry are only cut once. 0 to cut all of them.')
+    arg.add_argument('-j', dest='jobs', action='store', type=int,
+                     default=1,
+                     help='Number of processes writing the slabs, 0 for all the CPUs.')
+
+    args = arg.parse_args(cml)
+    if len(args.hkl) % 3:
+        arg.error('The number of Miller indices should be a multiple of 3!')
+    args.hkl = [tuple(args.hkl[ii:ii+3]) for ii in range(0, len(args.hkl), 3)]
+    args.delete_atomic_layer = args.delete_atomic_layer or [[]]
+    args.fix_atomic_layers = args.fix_atomic_layers or [[]]
+
+    return args
+
+def unique_facets(atoms, hkls, symprec=1E-3):
     '''
+    The Miller indices "hkls" without those equivalent by the symmetry of
+    "atoms" to a previous one, i.e. "hkl M^T" for any rotation M, together
+    with the removed ones.
     '''
-    natoms = pos_z.size
-    natoms_per_layers = []
-    indices_for_layers = []
-    remaining_atoms = np.ones(natoms, dtype=bool)
-
-    while np.sum(natoms_per_layers) != natoms:
-        layer_center = pos_z[remaining_atoms].min()
-        layer_indices = np.arange(natoms, dtype=int)[
-                (layer_center - layer_thickness/2. < pos_z)
-                &
-                (layer_center + layer_thickness/2. > pos_z)
-            ]
-
-        remaining_atoms[layer_indices] = False
-        indices_for_layers.append(layer_indices)
-        natoms_per_layers.append(len(layer_indices))
-        
-        if np.sum(remaining_atoms) == 0:
-            break
-
-    n_atomic_layers = len(natoms_per_layers)
-
-    return n_atomic_layers, natoms_per_layers, indices_for_layers
-
-
-def cut_slab(cml):
+    if symprec <= 0 or len(hkls) < 2:
+        return list(hkls), []
+
+    rotations = np.unique(symmetry_operations(atoms, symprec)[0], axis=0)
+    kept, skipped = [], []
+    seen = set()
+    for hkl in hkls:
+        if tuple(hkl) in seen:
+            skipped.append(hkl)
+            continue
+        kept.append(hkl)
+        seen.update(
+            tuple(x) for x in np.dot(np.array(hkl), np.transpose(rotations, (0, 2, 1))).tolist()
+        )
+
+    return kept, skipped
+
+
+def make_slab(primitive_cell, hkl, nlayer, args,
+              delete_atomic_layer=None, fix_atomic_layers=None, verbose=True):
     '''
+    Cut the slab of "nlayer" layers with surface "hkl" from the bulk
+    "primitive_cell", delete and fix the specified atomic layers and
+    rearrange the atoms. The number of atomic layers found is printed if
+    "verbose".
     '''
-    args = parse_cml_args(cml)
+    from ase.build import surface
+    from ase.constraints import FixAtoms
 
-    primitive_cell = read(args.poscar)
-    slab = surface(primitive_cell, args.hkl, layers=args.nlayer)
+    slab = surface(primitive_cell, hkl, layers=nlayer)
 
     pos_z = slab.positions.copy()[:, 'xyz'.index(args.ivacuum)]
     n_atomic_layers, natoms_per_layers, indices_for_layers = \
     find_natoms_layers(pos_z, args.layer_thickness)
-    print("{} atomic layers found!".format(n_atomic_layers))
+    if verbose:
+        print("{} atomic layers found!".format(n_atomic_layers))
 
-    if args.delete_atomic_layer:
+    if delete_atomic_layer:
         kept_atoms = [
                 ii for jj in range(n_atomic_layers)
                    for ii in indices_for_layers[jj]
-                   if jj not in args.delete_atomic_layer
+                   if jj not in delete_atomic_layer
                 ]
         slab = slab[kept_atoms]
 
@@ -100,48 +115,111 @@ def cut_slab(cml):
         n_atomic_layers, natoms_per_layers, indices_for_layers = \
         find_natoms_layers(pos_z, args.layer_thickness)
 
-    if args.fix_atomic_layers:
+    if fix_atomic_layers:
         C = FixAtoms(indices=[ii for jj in range(n_atomic_layers)
-                                 for ii in indices_for_layers[jj] 
-                                 if jj in args.fix_atomic_layers])
+                                 for ii in indices_for_layers[jj]
+                                 if jj in fix_atomic_layers])
         slab.set_constraint(C)
 
 
     slab.center(args.vacuum / 2, axis='xyz'.index(args.ivacuum))
-    org_chem_symbols = np.array(slab.get_chemical_symbols())
-    org_atom_index = np.arange(len(slab), dtype=int)
-
-    # Sort first by z-coordinates then by y and x.
-    rpos = np.round(slab.positions, 4)
-    new_atom_index = np.lexsort(
-            (rpos[:, 0], rpos[:, 1], rpos[:, 2])
-            )
-    slab = slab[new_atom_index]
-
-    # New order of chemical symbols
-    if args.new_sym_order:
-        assert set(args.new_sym_order) == set(org_chem_symbols)
-        chem_sym_order = args.new_sym_order
-    else:
-        # Just stick to the original order.
-        chem_sym_order = []
-        for ss in primitive_cell.get_chemical_symbols():
-            if not ss in chem_sym_order:
-                chem_sym_order.append(ss)
-
-    # Re-arrange the atoms according to the new order of chemical symbols
-    new_atom_index = [ii for ss in chem_sym_order
-                         for ii in org_atom_index[slab.symbols == ss]]
-    slab = slab[new_atom_index]
-
-    if args.out is None:
-        outF = 'out_{}{}{}_{}.vasp'.format(
-                args.hkl[0], args.hkl[1], args.hkl[2], args.nlayer
-                )
-        write(outF, slab, vasp5=True)
+
+    # Sort by the chemical symbols, in the new order or in the original one,
+    # then by z, y and x-coordinates.
+    slab = sort_atoms(slab, args.new_sym_order or symbol_order(primitive_cell))
+
+    return slab
+
+
+def slab_name(hkl, nlayer, delete_atomic_layer, fix_atomic_layers, args):
+    '''
+    The default output filename of the slab, the deleted and fixed layers are
+    included if several of them are specified.
+    '''
+    name = 'out_{}{}{}_{}'.format(hkl[0], hkl[1], hkl[2], nlayer)
+    if len(args.delete_atomic_layer) > 1 and delete_atomic_layer:
+        name += '_d' + '-'.join(map(str, delete_atomic_layer))
+    if len(args.fix_atomic_layers) > 1 and fix_atomic_layers:
+        name += '_f' + '-'.join(map(str, fix_atomic_layers))
+
+    return name + '.vasp'
+
+
+# the bulk structure shared by the worker processes
+_primitive_cell = None
+
+def _init_worker(primitive_cell):
+    global _primitive_cell
+    _primitive_cell = primitive_cell
+
+
+def _slab_task(task):
+    '''
+    Cut and write all the slabs of one surface and number of layers, quietly
+    as the workers would interleave their output.
+    '''
+    hkl, nlayer, specs, outdir, args = task
+    written = []
+    for delete, fix in specs:
+        outF = os.path.join(outdir, slab_name(hkl, nlayer, delete, fix, args))
+        slab = make_slab(_primitive_cell, hkl, nlayer, args, delete, fix,
+                         verbose=False)
+        write_poscar(outF, slab, direct=False)
+        written.append(outF)
+
+    return written
+
+
+def cut_slab(cml):
+    '''
+    Cut the slabs of all the combinations of the surfaces, numbers of layers,
+    deleted and fixed layers from the bulk. The surfaces equivalent by
+    symmetry are only cut once. The slabs are written by "-j" processes.
+    '''
+    args = parse_cml_args(cml)
+    from ase.io import read, write
+
+    primitive_cell = read(args.poscar)
+
+    hkls, skipped = unique_facets(primitive_cell, args.hkl, args.symprec)
+    for hkl in skipped:
+        print("({} {} {}) skipped, equivalent by symmetry!".format(*hkl))
+
+    specs = list(product(args.delete_atomic_layer, args.fix_atomic_layers))
+    if len(hkls) * len(args.nlayer) * len(specs) == 1:
+        # a single slab, to the given filename
+        delete, fix = specs[0]
+        slab = make_slab(primitive_cell, hkls[0], args.nlayer[0], args,
+                         delete, fix)
+        if args.out is None:
+            outF = slab_name(hkls[0], args.nlayer[0], delete, fix, args)
+            write_poscar(outF, slab, direct=False)
+        else:
+            outF = args.out
+            write(outF, slab)
+        return
+
+    outdir = '.' if args.out is None else args.out
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    tasks = [(hkl, nlayer, specs, outdir, args)
+             for hkl in hkls for nlayer in args.nlayer]
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+        pool = Pool(min(jobs, len(tasks)), initializer=_init_worker,
+                    initargs=(primitive_cell,))
+        try:
+            results = pool.map(_slab_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
     else:
-        outF = args.out
-        write(outF, slab)
+        _init_worker(primitive_cell)
+        results = [_slab_task(task) for task in tasks]
+
+    print("{} slabs written to {}".format(sum(map(len, results)), outdir))
 
 if __name__ == '__main__':
     cut_slab(sys.argv[1:])
@@ -1,38 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import numpy as np
 import sys, argparse
-from ase.io import read, write
+from ase.io import read
 from ase.collections import g2
 from ase.build import molecule
+from structops import (rotate_molecule, sort_atoms, symbol_order,
+                       write_poscar, poscar_label, lattice_shifts,
+                       min_distances, symmetry_operations)
 
-def add_mol(cml):
-    arg = parse_cml_args(cml)
-
-    slab = read(arg.slab)
-
+def prepare_molecule(slab, arg):
+    '''
+    The molecule in the cell of the slab, rotated as specified.
+    '''
     assert arg.molecule is not None, "Please specify the name of the adsorbates."
     mol = molecule(arg.molecule, pbc=slab.pbc, cell=slab.cell)
     mol.center()
 
     print (' '.join(mol.get_chemical_symbols()))
 
-    if arg.rot:
-        for za in arg.rot:
-            if za[0].lower() in 'xyz':
-                axis = za[0].lower()
-                angle = za[1:]
-            else:
-                axis = 'z'
-                angle = za
-
-            try:
-                angle = float(angle)
-            except:
-                print("Please enter valid rotation parameter, e.g. z90!")
-                raise
-            mol.rotate(angle, axis)
+    rotate_molecule(mol, arg.rot)
 
     if arg.rotx:
         mol.rotate(arg.rotx, 'x')
@@ -41,8 +30,12 @@ def add_mol(cml):
     if arg.rotz:
         mol.rotate(arg.rotz, 'z')
 
-    mol.positions += slab.positions[arg.atom_index] - mol.positions[arg.mol_index]
-    mol.positions += [arg.offset[0], arg.offset[1], arg.height]
+    return mol
+
+def combine(slab, mol, arg):
+    '''
+    The slab with the adsorbed molecule, centered and sorted.
+    '''
     new = slab + mol
 
     # add vacuum 
@@ -57,29 +50,280 @@ def add_mol(cml):
         # length.
         new.center(axis=2)
 
-    org_atom_index = np.arange(len(new), dtype=int)
+    # Sort by the chemical symbols in the original order, then by z, y and
+    # x-coordinates.
+    return sort_atoms(new, symbol_order(slab + mol), arg.sort_pos)
+
+def add_mol(cml):
+    arg = parse_cml_args(cml)
+
+    slab = read(arg.slab)
+    mol = prepare_molecule(slab, arg)
+
+    if arg.sites:
+        enumerate_adsorption(slab, mol, arg)
+        return
+
+    mol.positions += slab.positions[arg.atom_index] - mol.positions[arg.mol_index]
+    mol.positions += [arg.offset[0], arg.offset[1], arg.height]
+    new = combine(slab, mol, arg)
+
+    write_poscar(arg.out, new, label=poscar_label(arg.slab))
+
+############################################################
+# Enumeration of the adsorption configurations
+############################################################
+
+# neighbors of the surface atoms forming the bridge sites are within this
+# factor of the nearest-neighbor distance, the atoms around the hollow sites
+# within twice of it
+SITE_NEIGHBOR_FACTOR = 1.2
+
+def hollow_sites(surf, pts, cutoff, tol=1E-3):
+    '''
+    The hollow sites among the surface atoms "surf", whose periodic images
+    are "pts", i.e. the centers of the circles through three or more atoms,
+    within "cutoff" of each other, with no other atom inside in the surface
+    plane. These are the circumcenters of the Delaunay triangles of the atoms
+    projected onto the surface, and the triangles of the same circle, e.g.
+    the two halves of a square, give the same 4-fold hollow. The obtuse
+    triangles, whose circumcenters are outside of them, are skipped.
+    '''
+    xy = pts[:, :2]
+    hollow = []
+    for ii in range(len(surf)):
+        dist = np.linalg.norm(xy - surf[ii, :2], axis=1)
+        nb = np.nonzero((dist > 1E-6) & (dist < cutoff))[0]
+        jj, kk = np.nonzero(np.triu(np.ones((nb.size, nb.size), dtype=bool), 1))
+        jj, kk = nb[jj], nb[kk]
+
+        # the circumcenters of the triangles (i, j, k) in the plane
+        a = xy[jj] - surf[ii, :2]
+        b = xy[kk] - surf[ii, :2]
+        det = 2 * (a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+        ok = np.abs(det) > tol * cutoff**2
+        a, b, det, jj, kk = a[ok], b[ok], det[ok], jj[ok], kk[ok]
+        aa, bb = np.sum(a**2, axis=1), np.sum(b**2, axis=1)
+        center = np.column_stack([b[:, 1] * aa - a[:, 1] * bb,
+                                  a[:, 0] * bb - b[:, 0] * aa]) / det[:, None]
+        radius = np.linalg.norm(center, axis=1)
+
+        # the circumcenter inside or on the edges of the triangle
+        w = np.linalg.solve(np.stack([a, b], axis=-1),
+                            center[:, :, None])[:, :, 0]
+        ok = np.all(w > -tol, axis=1) & (w.sum(axis=1) < 1 + tol)
+
+        # no other atom inside the circle
+        center += surf[ii, :2]
+        inside = np.linalg.norm(center[:, None, :] - xy[None, :, :], axis=-1) \
+            < radius[:, None] - tol
+        ok &= ~np.any(inside, axis=1)
+
+        z = (surf[ii, 2] + pts[jj, 2] + pts[kk, 2]) / 3.
+        hollow.append(np.column_stack([center, z])[ok])
+
+    return np.concatenate(hollow) if hollow else np.zeros((0, 3))
+
+def surface_sites(slab, kinds=('top', 'bridge', 'hollow'), depth=1.0):
+    '''
+    The adsorption sites of "kinds" on the top of "slab", i.e. the top sites on
+    the atoms within "depth" of the topmost one, the bridge sites between two
+    neighboring atoms and the 3-fold and 4-fold hollow sites, see
+    "hollow_sites", including the periodic images in the surface plane.
+    Returns the kinds and the positions of the sites, which are wrapped into
+    the cell.
+    '''
+    cell = slab.cell[:]
+    inplane = np.array([slab.pbc[0], slab.pbc[1], False])
+    surf = slab.positions[slab.positions[:, 2] > slab.positions[:, 2].max() - depth]
+
+    def images(cutoff):
+        shifts = np.dot(lattice_shifts(cell, inplane, cutoff), cell)
+        return (surf[None, :, :] + shifts[:, None, :]).reshape((-1, 3))
+
+    # the nearest neighbor is closer than the image of the atom itself
+    lengths = np.linalg.norm(cell[:2], axis=1)[inplane[:2]]
+    pts = images(lengths.min() if lengths.size else 0.0)
+    dist = np.linalg.norm(surf[:, None, :] - pts[None, :, :], axis=-1)
+    dist[dist < 1E-6] = np.inf
+    cutoff = SITE_NEIGHBOR_FACTOR * dist.min()
+
+    pts = images(cutoff)
+    dist = np.linalg.norm(surf[:, None, :] - pts[None, :, :], axis=-1)
+    neighbors = (dist > 1E-6) & (dist < cutoff)
+
+    sites = {'top': surf}
+    if 'bridge' in kinds:
+        ii, pp = np.nonzero(neighbors)
+        sites['bridge'] = (surf[ii] + pts[pp]) / 2.
+    if 'hollow' in kinds:
+        # the atoms of a Delaunay triangle are within twice the
+        # nearest-neighbor distance, and those inside its circle within
+        # 2 / sqrt(3) of it
+        rmax = 2 * cutoff / SITE_NEIGHBOR_FACTOR
+        sites['hollow'] = hollow_sites(surf, images(1.2 * rmax), rmax)
+
+    names, positions = [], []
+    for kind in kinds:
+        # wrapped into the cell, the duplicates removed, the hollow sites of
+        # the same circle only by their in-plane positions
+        frac = np.linalg.solve(cell.T, sites[kind].T).T
+        frac[:, inplane] -= np.floor(frac[:, inplane] + 1E-6)
+        key = frac[:, :2] if kind == 'hollow' else frac
+        _, first = np.unique(np.round(key, 4) % 1.0, axis=0, return_index=True)
+        positions.append(np.dot(frac[np.sort(first)], cell))
+        names += [kind] * len(first)
+
+    return names, np.concatenate(positions)
+
+def place_candidates(mol, sites, zrots, heights, mol_index=0, offset=(0.0, 0.0)):
+    '''
+    The positions of the molecule for each of the "sites", rotations around z
+    by "zrots" in degrees and "heights", with the atom "mol_index" of "mol"
+    "height" above the site as in the placement of a single molecule. Returns
+    an array of shape (nsites, nrots, nheights, natoms, 3).
+    '''
+    rel = mol.positions - mol.positions[mol_index]
+    angles = np.deg2rad(zrots)
+    c, s = np.cos(angles), np.sin(angles)
+    zero, one = np.zeros_like(c), np.ones_like(c)
+    rotz = np.array([[c, -s, zero], [s, c, zero], [zero, zero, one]]).transpose((2, 0, 1))
+    rel = np.einsum('rij,mj->rmi', rotz, rel)
+
+    lift = np.zeros((len(heights), 3))
+    lift[:, 0], lift[:, 1], lift[:, 2] = offset[0], offset[1], heights
+
+    return (sites[:, None, None, None, :] + rel[None, :, None, :, :]
+            + lift[None, None, :, None, :])
+
+def clashes(slab, mol_positions, min_dist):
+    '''
+    Whether the molecules at "mol_positions", of shape (ncandidates, natoms,
+    3), are closer than "min_dist" to the slab or to their own periodic
+    images.
+    '''
+    ncand, natoms = mol_positions.shape[:2]
+    dist = min_distances(mol_positions.reshape((-1, 3)), slab, min_dist)
+    clash = np.any(dist.reshape((ncand, natoms)) < min_dist, axis=1)
+
+    shifts = lattice_shifts(slab.cell[:], slab.pbc, min_dist)
+    shifts = np.dot(shifts[np.any(shifts != 0, axis=1)], slab.cell[:])
+    rel = mol_positions - mol_positions[:, :1, :]
+    for shift in shifts:
+        diff = rel[:, :, None, :] + shift - rel[:, None, :, :]
+        clash |= np.any(np.linalg.norm(diff, axis=-1) < min_dist, axis=(1, 2))
+
+    return clash
 
-    # Sort first by z-coordinates then by y and x.
-    if arg.sort_pos:
-        rpos = np.round(new.positions, 4)
-        new_atom_index = np.lexsort(
-                (rpos[:, 0], rpos[:, 1], rpos[:, 2])
-                )
-        new = new[new_atom_index]
+def unique_placements(slab, mol_numbers, mol_positions, symprec=0.01):
+    '''
+    The indices of the first of each set of "mol_positions", of shape
+    (ncandidates, natoms, 3), equivalent by a symmetry operation of "slab".
+    Each placement is represented by the smallest, over the operations, of the
+    transformed positions on a grid of "symprec" Angstrom, sorted within each
+    species, and the placements of the same representation are equivalent.
+    '''
+    cell = slab.cell[:]
+    rotations, translations = symmetry_operations(slab, symprec)
+    ngrid = np.ceil(np.linalg.norm(cell, axis=1) / symprec).astype(np.int64)
+    if np.prod(ngrid.astype(float)) > 2.**62:
+        raise ValueError('symprec %g is too small for the cell!' % symprec)
+
+    ncand, natoms = mol_positions.shape[:2]
+    scaled = np.dot(mol_positions.reshape((-1, 3)),
+                    np.linalg.inv(cell)).reshape((ncand, natoms, 3))
+    groups = [np.nonzero(mol_numbers == z)[0] for z in np.unique(mol_numbers)]
+
+    keys = np.empty((ncand, natoms), dtype=np.int64)
+    chunk = max(1, 2**20 // (len(rotations) * natoms))
+    for ii in range(0, ncand, chunk):
+        new = (np.einsum('cmi,kij->ckmj', scaled[ii:ii+chunk], rotations)
+               + translations[None, :, None, :])
+        grid = np.rint(new * ngrid).astype(np.int64) % ngrid
+        key = (grid[..., 0] * ngrid[1] + grid[..., 1]) * ngrid[2] + grid[..., 2]
+        key = np.concatenate([np.sort(key[..., g], axis=-1) for g in groups],
+                             axis=-1)
+        # the lexicographically smallest over the operations
+        best = np.ones(key.shape[:2], dtype=bool)
+        for jj in range(natoms):
+            col = np.where(best, key[..., jj], np.iinfo(np.int64).max)
+            best &= col == col.min(axis=1)[:, None]
+        keys[ii:ii+chunk] = key[np.arange(len(key)), np.argmax(best, axis=1)]
+
+    _, first = np.unique(keys, axis=0, return_index=True)
 
-    # Just stick to the original order.
-    chem_sym_order = []
-    for ss in slab.get_chemical_symbols() + mol.get_chemical_symbols():
-        if not ss in chem_sym_order:
-            chem_sym_order.append(ss)
+    return np.sort(first)
 
-    # Re-arrange the atoms according to the new order of chemical symbols
-    new_atom_index = [ii for ss in chem_sym_order
-                         for ii in org_atom_index[new.symbols == ss]]
-    new = new[new_atom_index]
+# the slab, molecule and options shared by the worker processes
+_ENUMERATION = None
+
+def _init_worker(enumeration):
+    global _ENUMERATION
+    _ENUMERATION = enumeration
+
+def _write_task(task):
+    '''
+    Write the configurations of "task", a list of (filename, positions).
+    '''
+    slab, mol, arg, label = _ENUMERATION
+    for fname, positions in task:
+        new_mol = mol.copy()
+        new_mol.positions = positions
+        write_poscar(fname, combine(slab, new_mol, arg), label=label)
+
+    return len(task)
+
+def enumerate_adsorption(slab, mol, arg):
+    '''
+    Write the adsorption configurations of "mol" on all the sites of
+    "arg.sites" with all the rotations around z "arg.zrots" and heights
+    "arg.heights", without those where the molecule is closer than
+    "arg.min_dist" to the slab and those equivalent by symmetry to a previous
+    one.
+    '''
+    heights = arg.heights or [arg.height]
+    names, sites = surface_sites(slab, arg.sites, arg.surf_depth)
+    positions = place_candidates(mol, sites, arg.zrots, heights,
+                                 arg.mol_index, arg.offset)
+    shape = positions.shape[:3]
+    positions = positions.reshape((-1,) + positions.shape[3:])
+    print("{} sites, {} configurations".format(len(sites), len(positions)))
+
+    kept = np.nonzero(~clashes(slab, positions, arg.min_dist))[0]
+    print("{} configurations without clashes".format(len(kept)))
+    if arg.symprec > 0 and len(kept):
+        kept = kept[unique_placements(slab, mol.numbers, positions[kept],
+                                      arg.symprec)]
+        print("{} configurations not equivalent by symmetry".format(len(kept)))
+
+    if not os.path.isdir(arg.outdir):
+        os.makedirs(arg.outdir)
+    # the sites are numbered within each kind
+    index = [names[:ii].count(names[ii]) for ii in range(len(names))]
+    items = []
+    for nn in kept:
+        isite, irot, iheight = np.unravel_index(nn, shape)
+        fname = '{}{}_r{:g}_h{:g}.vasp'.format(
+            names[isite], index[isite], arg.zrots[irot], heights[iheight])
+        items.append((os.path.join(arg.outdir, fname), positions[nn]))
+
+    enumeration = (slab, mol, arg, poscar_label(arg.slab))
+    jobs = arg.jobs if arg.jobs > 0 else os.cpu_count()
+    tasks = [items[ii::jobs] for ii in range(jobs) if items[ii::jobs]]
+    if jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+        pool = Pool(len(tasks), initializer=_init_worker,
+                    initargs=(enumeration,))
+        try:
+            nwritten = sum(pool.map(_write_task, tasks, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(enumeration)
+        nwritten = _write_task(items)
 
-    write(arg.out, new, vasp5=True, direct=True,
-          label=open(arg.slab).readline().strip())
+    print("{} configurations written to {}".format(nwritten, arg.outdir))
 
 def parse_cml_args(cml):
     '''
@@ -128,6 +372,31 @@ def parse_cml_args(cml):
                      help='Vacuum direction.')
     arg.add_argument('--no-sort-pos', dest='sort_pos', action='store_false',
                      help='Sort the coordinates.')
+    arg.add_argument('--sites', dest='sites', action='store',
+                     type=str, default=None, nargs='+',
+                     choices=['top', 'bridge', 'hollow'],
+                     help='Enumerate the adsorption on all these sites of the top surface, with the rotations "--zrots" and heights "--heights".')
+    arg.add_argument('--zrots', dest='zrots', action='store',
+                     type=float, default=[0.0], nargs='+',
+                     help='Rotations around z-axis in degrees of the enumeration.')
+    arg.add_argument('--heights', dest='heights', action='store',
+                     type=float, default=None, nargs='+',
+                     help='Heights of the enumeration, default to "--height".')
+    arg.add_argument('--surf_depth', dest='surf_depth', action='store',
+                     type=float, default=1.0,
+                     help='The surface atoms are within this depth from the topmost one.')
+    arg.add_argument('--min_dist', dest='min_dist', action='store',
+                     type=float, default=1.5,
+                     help='The configurations where the adsorbate is closer than this to the slab are rejected.')
+    arg.add_argument('--symprec', dest='symprec', action='store',
+                     type=float, default=0.01,
+                     help='Tolerance in Angstrom of the symmetry of the slab, the configurations equivalent by symmetry are only written once. 0 to write all of them.')
+    arg.add_argument('--outdir', dest='outdir', action='store', type=str,
+                     default='sites',
+                     help='Output directory of the enumeration.')
+    arg.add_argument('-j', dest='jobs', action='store', type=int,
+                     default=1,
+                     help='Number of processes writing the configurations, 0 for all the CPUs.')
 
     return arg.parse_args(cml)
 
@@ -6,6 +6,7 @@ import sys, argparse
 from ase.io import read, write
 from ase.collections import g2
 from ase.build import molecule
+from structops import write_poscar, poscar_label
 
 def del_mol(cml):
     arg = parse_cml_args(cml)
@@ -27,8 +28,7 @@ def del_mol(cml):
         # length.
         new.center(axis=2)
 
-    write(arg.out, new, vasp5=True, direct=True,
-          label=open(arg.poscar).readline().strip())
+    write_poscar(arg.out, new, label=poscar_label(arg.poscar))
 
 def parse_cml_args(cml):
     '''
@@ -1,49 +1,134 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import glob
+import time
+import argparse
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 from subprocess import call
 
-plt.style.use('ggplot')
 
 ############################################################
-# Generating and Loading data
-# call vtst scripts to generate the MEP.
-call('nebbarrier.pl')
-call('nebspline.pl')
-
-# scatters of the barrier
-mep_d = np.loadtxt('neb.dat')
-# splines of the barrier
-mep_s = np.loadtxt('spline.dat')
-############################################################
-# Plotting
-
-nrows = 1; ncols = 1
-fig = plt.figure(
-    figsize = (4.8, 2.4)
-)
-axes = [
-    plt.subplot(nrows, ncols, ii+1)
-    for ii in range(ncols * nrows)
-]
-
-axes[0].plot(mep_s[:,1], mep_s[:,2], ls='-', lw=0.5, color='r', alpha=0.8)
-axes[0].plot(mep_d[:,1], mep_d[:,2], ls='none',
-             marker='*', ms=6, mew=0, mfc='b')
-
-axes[0].set_xlabel('Reaction Coordinate', labelpad=5)
-axes[0].set_ylabel('Energy [eV]', labelpad=5)
-
-plt.tight_layout()
-# plt.show()
-plt.savefig('mep.png', dpi=300)
-
-try:
-    from subprocess import call
-    call('feh -xdF mep.png'.split())
-except:
-    pass
+def nebplot(opts):
+    '''
+    Generate and plot the MEP of the NEB calculation in the current directory.
+    '''
+    import matplotlib as mpl
+    mpl.use('agg')
+    import matplotlib.pyplot as plt
+
+    plt.style.use('ggplot')
+
+    ############################################################
+    # Generating and Loading data
+    # call vtst scripts to generate the MEP.
+    call('nebbarrier.pl')
+    call('nebspline.pl')
+
+    # scatters of the barrier
+    mep_d = np.loadtxt('neb.dat')
+    # splines of the barrier
+    mep_s = np.loadtxt('spline.dat')
+    ############################################################
+    # Plotting
+
+    nrows = 1; ncols = 1
+    fig = plt.figure(
+        figsize = (4.8, 2.4)
+    )
+    axes = [
+        plt.subplot(nrows, ncols, ii+1)
+        for ii in range(ncols * nrows)
+    ]
+
+    axes[0].plot(mep_s[:,1], mep_s[:,2], ls='-', lw=0.5, color='r', alpha=0.8)
+    axes[0].plot(mep_d[:,1], mep_d[:,2], ls='none',
+                 marker='*', ms=6, mew=0, mfc='b')
+
+    axes[0].set_xlabel('Reaction Coordinate', labelpad=5)
+    axes[0].set_ylabel('Energy [eV]', labelpad=5)
+
+    plt.tight_layout()
+    # plt.show()
+    plt.savefig(opts.output, dpi=300)
+    plt.close(fig)
+
+
+def watch(opts):
+    '''
+    Re-plot the MEP whenever a new ionic step of any image is completed by the
+    running NEB calculation. For each OUTCAR of the images, the search for the
+    end of the ionic steps starts at the end of the last one found, so that
+    only the appended part of the file is read.
+    '''
+    from vaspio import FileWatcher, outcar_ionic_steps
+
+    # the OUTCARs of the end points, the first and last directories, are
+    # static and excluded
+    images = sorted(d for d in glob.glob('[0-9][0-9]') if os.path.isdir(d))
+    outcars = [os.path.join(d, 'OUTCAR') for d in images[1:-1]]
+    if not outcars:
+        raise IOError('No intermediate image found!')
+    offsets = dict((f, 0) for f in outcars)
+    nsteps = dict((f, 0) for f in outcars)
+
+    last = None
+    for changed in FileWatcher(outcars, opts.interval):
+        for outcar in changed:
+            steps = outcar_ionic_steps(outcar, offsets[outcar])
+            if len(steps):
+                nsteps[outcar] += len(steps)
+                offsets[outcar] = steps[-1] + 1
+
+        # all the intermediate images have completed the same number of ionic
+        # steps
+        current = min(nsteps.values())
+        if current == 0 or current == last:
+            continue
+        last = current
+        try:
+            nebplot(opts)
+        except Exception as e:
+            print('%s: %s' % (type(e).__name__, e))
+            continue
+        print('%s: %s updated, ionic step %d' % (
+            time.strftime('%H:%M:%S'), opts.output, current))
+
+
+def parse_cml_args():
+    '''
+    CML parser.
+    '''
+    arg = argparse.ArgumentParser(add_help=True)
+
+    arg.add_argument('-o', dest='output', action='store', type=str,
+                     default='mep.png',
+                     help='Output image name')
+    arg.add_argument('-q', dest='quiet', action='store_true',
+                     help='Do not show the image')
+    arg.add_argument('-watch', dest='watch', action='store_true',
+                     help='Keep running and re-plot whenever a new ionic step is completed by all the images')
+    arg.add_argument('-interval', dest='interval', action='store', type=float,
+                     default=2.0,
+                     help='Interval in seconds between the checks of the OUTCARs in "-watch" mode')
+
+    return arg.parse_args()
+
+
+if __name__ == '__main__':
+    opts = parse_cml_args()
+
+    if opts.watch:
+        try:
+            watch(opts)
+        except KeyboardInterrupt:
+            pass
+    else:
+        nebplot(opts)
 
+        if not opts.quiet:
+            try:
+                call(['feh', '-xdF', opts.output])
+            except:
+                pass
@@ -33,35 +33,48 @@ def nose_mass(temperature, ndof, t0, L):
     return Q
 
 
+def fixed_flags(atoms):
+    '''
+    The fixed directions of the atoms by the constraints, i.e. the selective
+    dynamics flags of VASP, as a boolean array of shape (natoms, 3) along the
+    cell vectors. None if there is no constraint.
+    '''
+    if not atoms.constraints:
+        return None
+
+    from ase.constraints import FixAtoms, FixScaled, FixedPlane, FixedLine
+    sflags = np.zeros((len(atoms), 3), dtype=bool)
+    for constr in atoms.constraints:
+        if isinstance(constr, FixScaled):
+            sflags[constr.a] = constr.mask
+        elif isinstance(constr, FixAtoms):
+            sflags[constr.index] = [True, True, True]
+        elif isinstance(constr, FixedPlane):
+            mask = np.all(np.abs(np.cross(constr.dir, atoms.cell)) < 1e-5,
+                          axis=1)
+            if sum(mask) != 1:
+                raise RuntimeError(
+                    'VASP requires that the direction of FixedPlane '
+                    'constraints is parallel with one of the cell axis')
+            sflags[constr.a] = mask
+        elif isinstance(constr, FixedLine):
+            mask = np.all(np.abs(np.cross(constr.dir, atoms.cell)) < 1e-5,
+                          axis=1)
+            if sum(mask) != 1:
+                raise RuntimeError(
+                    'VASP requires that the direction of FixedLine '
+                    'constraints is parallel with one of the cell axis')
+            sflags[constr.a] = ~mask
+
+    return sflags
+
+
 def cnt_dof(atoms):
     '''
     Count No. of Degrees of Freedom
     '''
-    if atoms.constraints:
-        from ase.constraints import FixAtoms, FixScaled, FixedPlane, FixedLine
-        sflags = np.zeros((len(atoms), 3), dtype=bool)
-        for constr in atoms.constraints:
-            if isinstance(constr, FixScaled):
-                sflags[constr.a] = constr.mask
-            elif isinstance(constr, FixAtoms):
-                sflags[constr.index] = [True, True, True]
-            elif isinstance(constr, FixedPlane):
-                mask = np.all(np.abs(np.cross(constr.dir, atoms.cell)) < 1e-5,
-                              axis=1)
-                if sum(mask) != 1:
-                    raise RuntimeError(
-                        'VASP requires that the direction of FixedPlane '
-                        'constraints is parallel with one of the cell axis')
-                sflags[constr.a] = mask
-            elif isinstance(constr, FixedLine):
-                mask = np.all(np.abs(np.cross(constr.dir, atoms.cell)) < 1e-5,
-                              axis=1)
-                if sum(mask) != 1:
-                    raise RuntimeError(
-                        'VASP requires that the direction of FixedLine '
-                        'constraints is parallel with one of the cell axis')
-                sflags[constr.a] = ~mask
-
+    sflags = fixed_flags(atoms)
+    if sflags is not None:
         return np.sum(~sflags)
     else:
         return len(atoms) * 3 - 3
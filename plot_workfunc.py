@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 '''
 A script to plot work function using LOCPOT.
-Requirement: python3, numpy, matplotlib, ase
+Requirement: python3, numpy, matplotlib
 Author: @Ionizing
 Date: 22:46, Jan 11th, 2021.
 CHANGELOG:
@@ -13,62 +13,261 @@ CHANGELOG:
 from argparse import ArgumentParser
 import os
 import logging
-import re
 import numpy as np
-import matplotlib.pyplot as plt
-from ase.calculators.vasp import VaspChargeDensity
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def locpot_mean(fname="LOCPOT", axis='z', savefile='locpot.dat', outcar="OUTCAR"):
+def get_efermi(outcar="OUTCAR"):
     '''
-    Reads the LOCPOT file and calculate the average potential along `axis`.
-     @in: See function argument.
-    @out:
-          - xvals: grid data along selected axis;
-          - mean: averaged potential corresponding to `xvals`.
+    The last E-fermi in `outcar`, None if not found. Only the end of OUTCAR
+    is read.
+    '''
+    from vaspio import read_outcar_efermi
+
+    if not os.path.isfile(outcar):
+        logger.warning("OUTCAR file not found. E-fermi set to 0.0eV")
+        return None
+    try:
+        efermi = read_outcar_efermi(outcar)
+    except (ValueError, IndexError):
+        logger.warning("E-fermi not found in {}. E-fermi set to 0.0eV".format(outcar))
+        return None
+    logger.info("Found E-fermi = {}".format(efermi))
+    return efermi
+
+
+def locpot_average(fname="LOCPOT", axis='z'):
     '''
-    def get_efermi(outcar="OUTCAR"):
-        if not os.path.isfile(outcar):
-            logger.warning("OUTCAR file not found. E-fermi set to 0.0eV")
-            return None
-        txt = open(outcar).read()
-        efermi = re.search(
-            r'E-fermi :\s*([-+]?[0-9]+[.]?[0-9]*([eE][-+]?[0-9]+)?)', txt).groups()[0]
-        logger.info("Found E-fermi = {}".format(efermi))
-        return float(efermi)
+    The planar average of the LOCPOT `fname` along `axis`, returns the grid
+    along the axis and the average. The LOCPOT is parsed in chunks and the
+    values are accumulated into the average, the 3D grid is not loaded into
+    memory.
+    '''
+    from vaspio import planar_average
 
     logger.info("Loading LOCPOT file {}".format(fname))
-    locd = VaspChargeDensity(fname)
-    cell = locd.atoms[0].cell
+    iaxis = ['x', 'y', 'z'].index(axis.lower())
+    logger.info("Calculating workfunction along {} axis".format(axis))
+    cell, grid, mean = planar_average(fname, iaxis)
     latlens = np.linalg.norm(cell, axis=1)
-    vol = np.linalg.det(cell)
 
-    iaxis = ['x', 'y', 'z'].index(axis.lower())
-    axes = [0, 1, 2]
-    axes.remove(iaxis)
-    axes = tuple(axes)
+    xvals = np.linspace(0, latlens[iaxis], grid[iaxis])
+    return xvals, mean
 
-    locpot = locd.chg[0]
-    # must multiply with cell volume, similar to CHGCAR
-    logger.info("Calculating workfunction along {} axis".format(axis))
-    mean = np.mean(locpot, axes) * vol
 
-    xvals = np.linspace(0, latlens[iaxis], locpot.shape[iaxis])
+def locpot_mean(fname="LOCPOT", axis='z', savefile='locpot.dat', outcar="OUTCAR"):
+    '''
+    Reads the LOCPOT file and calculate the average potential along `axis`.
+     @in: See function argument, the data is not saved if `savefile` is None.
+    @out:
+          - xvals: grid data along selected axis;
+          - mean: averaged potential corresponding to `xvals`.
+    '''
+    xvals, mean = locpot_average(fname, axis)
 
     # save to 'locpot.dat'
     efermi = get_efermi(outcar)
+    if efermi is not None:
+        mean -= efermi
+    if savefile is not None:
+        save_potential(savefile, efermi, [xvals, mean])
+    return (xvals, mean)
+
+
+def save_potential(savefile, efermi, columns, names=()):
+    '''
+    Save the `columns` of distance and potentials to `savefile`.
+    '''
     logger.info("Saving raw data to {}".format(savefile))
+    header = ' '.join(['Distance(A)', 'Potential(eV)'] + list(names))
     if efermi is None:
-        np.savetxt(savefile, np.c_[xvals, mean],
-                   fmt='%13.5f', header='Distance(A) Potential(eV) # E-fermi not corrected')
+        header += ' # E-fermi not corrected'
     else:
-        mean -= efermi
-        np.savetxt(savefile, np.c_[xvals, mean],
-                   fmt='%13.5f', header='Distance(A) Potential(eV) # E-fermi shifted to 0.0eV')
-    return (xvals, mean)
+        header += ' # E-fermi shifted to 0.0eV'
+    np.savetxt(savefile, np.column_stack(columns), fmt='%13.5f', header=header)
+
+
+def macroscopic_average(y, length, periods):
+    '''
+    The macroscopic average of the periodic planar average `y` over a cell of
+    `length` Angstrom, i.e. the successive running averages over windows of
+    each of the `periods` in Angstrom, e.g. the interlayer distances of the
+    two materials of an interface. The convolutions are done by FFT, where
+    the window of width L is the factor sin(qL/2) / (qL/2).
+    '''
+    q = 2 * np.pi * np.fft.fftfreq(y.size, d=length / y.size)
+    fy = np.fft.fft(y)
+    for period in periods:
+        fy *= np.sinc(q * period / (2 * np.pi))
+    return np.fft.ifft(fy).real
+
+
+def vacuum_level(y, tol=0.05):
+    '''
+    The vacuum level of the planar average `y`, i.e. the mean potential of the
+    widest region, periodic along the axis, within `tol` eV of the maximum.
+    Returns the level and the indices of the region.
+    '''
+    near = y >= y.max() - tol
+    if near.all():
+        return y.mean(), np.arange(y.size)
+
+    # start from a point outside of the vacuum so that no region is split
+    shift = np.argmin(near)
+    edges = np.diff(np.r_[0, np.roll(near, -shift).astype(int), 0])
+    starts, ends = np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]
+    iwide = np.argmax(ends - starts)
+    region = (np.arange(starts[iwide], ends[iwide]) + shift) % y.size
+    return y[region].mean(), region
+
+
+def output_names(args, fname):
+    '''
+    The OUTCAR, data file and image of the LOCPOT `fname`. For several
+    LOCPOTs, the files are those in the directory of each LOCPOT.
+    '''
+    dname = os.path.dirname(fname)
+    outcar = os.path.join(dname, "OUTCAR")
+    if len(args.input) == 1:
+        return outcar, args.write, args.output
+    return (outcar, os.path.join(dname, args.write),
+            os.path.join(dname, args.output))
+
+
+def plot_workfunc(args, fname=None):
+    '''
+    Calculate the averaged potential of the LOCPOT `fname`, default to the
+    first of `args.input`, and plot it to `args.output`.
+
+    Returns the name of LOCPOT, E-fermi, the vacuum level and the work
+    function, the last three are relative to the origin of the potential if
+    E-fermi is not found.
+    '''
+    if fname is None:
+        fname = args.input[0]
+    outcar, savefile, output = output_names(args, fname)
+
+    efermi = get_efermi(outcar)
+    x, y = locpot_average(fname, args.axis)
+    if efermi is not None:
+        y -= efermi
+
+    columns, names = [x, y], []
+    if args.macro:
+        length = x[-1]
+        ymac = macroscopic_average(y, length, args.macro)
+        columns.append(ymac)
+        names.append('Macroscopic(eV)')
+    save_potential(savefile, efermi, columns, names)
+
+    vac, region = vacuum_level(y, args.vactol)
+    workfunc = vac if efermi is not None else None
+    logger.info("Vacuum level = {:.4f} eV over {:.2f} A{}".format(
+        vac, region.size * x[-1] / x.size,
+        '' if workfunc is None else ', work function = {:.4f} eV'.format(workfunc)))
+
+    if args.noplot:
+        return fname, efermi, vac, workfunc
+
+    logger.info("Plotting to image")
+    import matplotlib as mpl
+    mpl.use('agg')
+    import matplotlib.pyplot as plt
+
+    plt.plot(x, y, color='k')
+    if args.macro:
+        plt.plot(x, ymac, color='r', ls='--', lw=1.0)
+    plt.axhline(vac, color='b', ls=':', lw=1.0)
+    if workfunc is not None:
+        plt.text(0.02, 0.98, r'$\Phi$ = {:.3f} eV'.format(workfunc),
+                 ha='left', va='top', color='b',
+                 transform=plt.gca().transAxes)
+    plt.xlabel('Distance(A)')
+    plt.ylabel('Potential(eV)')
+    plt.grid(color='gray', ls='-.')
+    plt.xlim(0, np.max(x))
+    plt.ylim(np.min(y)-0.5, np.max(y)+0.5)
+
+    if args.title:
+        plt.title(args.title)
+
+    logger.info("Saving to {}".format(output))
+    plt.savefig(output, dpi=args.dpi)
+    plt.close('all')
+
+    return fname, efermi, vac, workfunc
+
+
+def _plot_task(task):
+    args, fname = task
+    try:
+        return plot_workfunc(args, fname)
+    except Exception as e:
+        logger.warning("{}: {}: {}".format(fname, type(e).__name__, e))
+        return None
+
+
+def run(args):
+    '''
+    Process all the LOCPOTs of `args.input` in `args.jobs` processes and print
+    a summary of the work functions.
+    '''
+    if len(args.input) == 1:
+        plot_workfunc(args)
+        return
+
+    tasks = [(args, fname) for fname in args.input]
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if jobs > 1:
+        from multiprocessing import Pool
+        pool = Pool(min(jobs, len(tasks)))
+        try:
+            results = pool.map(_plot_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_plot_task(task) for task in tasks]
+
+    fmt = lambda x: '{:12.4f}'.format(x) if x is not None else '{:>12s}'.format('-')
+    print('# {:<40s} {:>12s} {:>12s} {:>12s}'.format(
+        'LOCPOT', 'E-fermi', 'E-vacuum', 'WorkFunc'))
+    for fname, result in zip(args.input, results):
+        if result is None:
+            print('  {:<40s} {:>12s}'.format(fname, 'failed'))
+        else:
+            print('  {:<40s} {} {} {}'.format(fname, *[fmt(x) for x in result[1:]]))
+
+
+def watch(args):
+    '''
+    Re-plot the work function whenever LOCPOT or OUTCAR of a running
+    calculation is modified, only that of the modified files for several
+    LOCPOTs. LOCPOT is rewritten as a whole by VASP, hence it
+    is read again, the errors due to a partially written file are logged and
+    the plot is retried at the next modification.
+    '''
+    from vaspio import FileWatcher
+
+    # the LOCPOTs to be re-plotted when each of the files is modified
+    triggers = {}
+    for fname in args.input:
+        for f in (fname, output_names(args, fname)[0]):
+            triggers.setdefault(f, []).append(fname)
+
+    for changed in FileWatcher(list(triggers), args.interval):
+        updated = set()
+        for f in changed:
+            updated.update(triggers[f])
+        for fname in args.input:
+            if fname not in updated or not os.path.isfile(fname):
+                continue
+            try:
+                plot_workfunc(args, fname)
+            except Exception as e:
+                logger.warning("{}: {}".format(type(e).__name__, e))
 
 
 def parse_cml_arguments():
@@ -76,8 +275,8 @@ def parse_cml_arguments():
         description='A tool to plot work function according to LOCPOT', add_help=True)
     parser.add_argument('-a', '--axis', type=str, action='store',
                         help='Which axis to be calculated: x, y or z. Default by z', default='z', choices=['x', 'y', 'z'])
-    parser.add_argument('input', nargs='?', type=str,
-                        help='The input file name, default by LOCPOT', default='LOCPOT')
+    parser.add_argument('input', nargs='*', type=str,
+                        help='The input file names, default by LOCPOT. For several files, the data and image are saved in the directory of each file, together with its OUTCAR', default=['LOCPOT'])
     parser.add_argument('-w', '--write', type=str, action='store',
                         help='Save raw work function data to file, default by locpot.dat', default='locpot.dat')
     parser.add_argument('-o', '--output', type=str, action='store',
@@ -86,23 +285,27 @@ def parse_cml_arguments():
                         help='DPI of output image, default by 400', default=400)
     parser.add_argument('--title', type=str, action='store',
                         help='Title in output image. If none, no title is added, default is None', default=None)
+    parser.add_argument('--macro', type=float, action='store', nargs='+',
+                        help='Periods in Angstrom of the macroscopic average, e.g. the interlayer distances, default is None', default=None)
+    parser.add_argument('--vactol', type=float, action='store',
+                        help='The vacuum level is the average potential within this tolerance in eV of the maximum, default by 0.05', default=0.05)
+    parser.add_argument('-j', '--jobs', type=int, action='store',
+                        help='Number of processes for several input files, 0 for all the CPUs, default by 1', default=1)
+    parser.add_argument('--noplot', action='store_true',
+                        help='Only save the data, no image is created')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and re-plot whenever LOCPOT or OUTCAR is rewritten')
+    parser.add_argument('--interval', type=float, action='store',
+                        help='Interval in seconds between the checks of the files in "--watch" mode, default by 2.0', default=2.0)
     return parser.parse_args()
 
 
 if '__main__' == __name__:
     args = parse_cml_arguments()
-    x, y = locpot_mean(args.input, args.axis, args.write)
-
-    logger.info("Plotting to image")
-    plt.plot(x, y, color='k')
-    plt.xlabel('Distance(A)')
-    plt.ylabel('Potential(eV)')
-    plt.grid(color='gray', ls='-.')
-    plt.xlim(0, np.max(x))
-    plt.ylim(np.min(y)-0.5, np.max(y)+0.5)
-
-    if args.title:
-        plt.title(args.title)
-
-    logger.info("Saving to {}".format(args.output))
-    plt.savefig(args.output, dpi=args.dpi)
+    if args.watch:
+        try:
+            watch(args)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run(args)
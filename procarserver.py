@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+A long-lived local server keeping the parsed PROCARs in memory, shared by
+npband and npdos.
+
+The server listens on a Unix domain socket, only accessible by its owner, in a
+per-user runtime directory. The clients check the owner of the socket and
+authenticate with a random key, readable only by the owner, before any pickle
+is exchanged. The server processes the requests one at a time. Each request
+is a tuple "(name, cwd, args)":
+
+    ("run",   cwd, cml)                        : run the tool with the command
+                                                 line arguments "cml" in "cwd",
+                                                 returns its output
+    ("call",  cwd, (inf, kwargs, method, a, kw)): returns the value of
+                                                 "procar(inf, **kwargs).method(*a, **kw)"
+    ("stats", cwd, ())                         : the content of the cache
+
+The procar objects are kept in an LRU cache, whose memory is limited by
+"-memory" or the environment variable PYBAND_SERVER_MEMORY in MB.
+'''
+
+from __future__ import print_function, division
+
+import os
+import io
+import sys
+import time
+import signal
+import tempfile
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+
+############################################################
+# Default memory limit of the procar objects of the server, in MB
+SERVER_MEMORY = 2048
+############################################################
+
+
+def runtime_dir():
+    '''
+    The per-user directory of the sockets, "$XDG_RUNTIME_DIR/pyband" or
+    "pyband-<uid>" in the temporary directory, created with mode 0700. Raises
+    PermissionError if it is owned by another user or accessible by others.
+    '''
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    if base and os.path.isdir(base):
+        dname = os.path.join(base, 'pyband')
+    else:
+        dname = os.path.join(tempfile.gettempdir(),
+                             'pyband-%d' % os.getuid())
+    try:
+        os.mkdir(dname, 0o700)
+    except FileExistsError:
+        pass
+    check_owner(dname, 0o077)
+
+    return dname
+
+
+def check_owner(path, mode=0o022):
+    '''
+    Raises PermissionError unless "path" is owned by the current user and
+    none of the permission bits "mode" is set, i.e. writable only by the
+    owner by default. Symbolic links are not followed.
+    '''
+    st = os.lstat(path)
+    if st.st_uid != os.getuid():
+        raise PermissionError('"%s" is not owned by the current user!' % path)
+    if st.st_mode & mode:
+        raise PermissionError('"%s" is accessible by other users!' % path)
+
+
+def default_address(tool):
+    '''
+    The socket of the server of "tool", given by the environment variable
+    PYBAND_SERVER_<TOOL>, e.g. PYBAND_SERVER_NPDOS, or in the per-user
+    runtime directory.
+    '''
+    address = os.environ.get('PYBAND_SERVER_%s' % tool.upper())
+    if address is None:
+        address = os.path.join(runtime_dir(), '%s.sock' % tool)
+
+    return address
+
+
+def key_file(address):
+    '''
+    The file of the authentication key of the server on "address".
+    '''
+    return address + '.key'
+
+
+def read_authkey(address):
+    '''
+    The authentication key of the server on "address", from a file only
+    accessible by the current user, which also owns the socket. Raises
+    PermissionError otherwise.
+    '''
+    check_owner(address)
+    fd = os.open(key_file(address), os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    with os.fdopen(fd, 'rb') as f:
+        st = os.fstat(fd)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError('The key of "%s" is not private to the '
+                                  'current user!' % address)
+        return f.read()
+
+
+def write_authkey(address):
+    '''
+    Create a new random authentication key of the server on "address",
+    readable only by the current user.
+    '''
+    fname = key_file(address)
+    if os.path.lexists(fname):
+        os.remove(fname)
+    authkey = os.urandom(32)
+    fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+
+    return authkey
+
+
+def server_memory(memory=None):
+    '''
+    Memory limit of the server in bytes, "memory" in MB.
+    '''
+    if memory is None:
+        try:
+            memory = float(os.environ.get('PYBAND_SERVER_MEMORY',
+                                          SERVER_MEMORY))
+        except ValueError:
+            memory = SERVER_MEMORY
+    return int(memory * 1024**2)
+
+
+def object_nbytes(obj, depth=2):
+    '''
+    The size of the numpy arrays held by the attributes of "obj", the
+    attributes which are objects themselves, e.g. SparseProjection, are
+    included up to "depth" levels.
+    '''
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if depth == 0 or not hasattr(obj, '__dict__'):
+        return 0
+    return sum(object_nbytes(v, depth - 1) for v in vars(obj).values())
+
+
+class ProcarCache(object):
+    '''
+    LRU cache of the objects created by "factory(inf, **kwargs)", e.g. the
+    procar objects of npdos, with the total size of their arrays limited to
+    "memory" bytes. The objects are identified by the absolute path, size and
+    modification time of "inf" and the "kwargs", except those in "ignored",
+    so that a modified PROCAR is parsed again. The most recently used object
+    is always kept, even if it is larger than the limit.
+    '''
+
+    def __init__(self, factory, memory=None, ignored=('cache', 'jobs')):
+        self.factory = factory
+        self.memory  = server_memory() if memory is None else memory
+        self.ignored = ignored
+        self.hits    = 0
+        self.misses  = 0
+        self._items  = OrderedDict()
+
+    def key(self, inf, kwargs):
+        st = os.stat(inf)
+        items = []
+        for k in sorted(kwargs):
+            if k in self.ignored:
+                continue
+            v = kwargs[k]
+            if isinstance(v, np.ndarray):
+                v = tuple(v.tolist())
+            elif isinstance(v, list):
+                v = tuple(v)
+            elif isinstance(v, np.dtype):
+                v = v.name
+            items.append((k, v))
+
+        return (os.path.abspath(inf), st.st_size, st.st_mtime) + tuple(items)
+
+    def get(self, inf, **kwargs):
+        key = self.key(inf, kwargs)
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+        self.misses += 1
+        # the outdated entries of the same file
+        for k in [k for k in self._items if k[0] == key[0]]:
+            del self._items[k]
+        obj = self.factory(inf, **kwargs)
+        self._items[key] = obj
+        self.evict()
+
+        return obj
+
+    def nbytes(self):
+        return sum(object_nbytes(v) for v in self._items.values())
+
+    def evict(self):
+        '''
+        Remove the least recently used objects beyond the memory limit.
+        '''
+        while len(self._items) > 1 and self.nbytes() > self.memory:
+            self._items.popitem(last=False)
+
+    def stats(self):
+        return {
+            'entries': [(k[0], object_nbytes(v))
+                        for k, v in self._items.items()],
+            'nbytes' : self.nbytes(),
+            'memory' : self.memory,
+            'hits'   : self.hits,
+            'misses' : self.misses,
+        }
+
+
+def _handle(message, run, cache):
+    '''
+    Process one request of the server, returns the result.
+    '''
+    name, cwd, args = message
+    os.chdir(cwd)
+
+    if name == 'run':
+        run(list(args), cache)
+        return None
+    elif name == 'call':
+        inf, kwargs, method, a, kw = args
+        return getattr(cache.get(inf, **kwargs), method)(*a, **kw)
+    elif name == 'stats':
+        return cache.stats()
+    else:
+        raise ValueError('Unknown request "%s"!' % name)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(address, run, factory, memory=None):
+    '''
+    Serve the requests on the Unix socket "address" until interrupted.
+    "run(cml, cache)" runs the tool with the command line arguments "cml",
+    getting the procar objects from "cache", a ProcarCache of "factory" with
+    "memory" MB. The output of the tool is returned to the client.
+    '''
+    from multiprocessing.connection import Listener
+    from multiprocessing import AuthenticationError
+
+    if os.path.lexists(address):
+        os.remove(address)
+    cache = ProcarCache(factory, server_memory(memory))
+
+    # the socket is only accessible by the owner and the clients have to know
+    # the key, as the requests are pickles
+    authkey = write_authkey(address)
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(umask)
+
+    # stop on "kill" as on Ctrl-C, so that the socket is removed
+    signal.signal(signal.SIGTERM, _interrupt)
+    print('Serving on {} with {:.0f} MB of memory'.format(
+        address, cache.memory / 1024**2))
+    sys.stdout.flush()
+
+    cwd = os.getcwd()
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            with conn:
+                try:
+                    message = conn.recv()
+                except (OSError, EOFError):
+                    continue
+
+                t0 = time.time()
+                stdout, stderr = sys.stdout, sys.stderr
+                sys.stdout = sys.stderr = output = io.StringIO()
+                try:
+                    result = ('ok', _handle(message, run, cache))
+                except Exception as e:
+                    traceback.print_exc()
+                    result = ('error', '%s: %s' % (type(e).__name__, e))
+                except SystemExit as e:
+                    # "-h" or wrong arguments of the tool
+                    result = ('error', 'SystemExit: %s' % e)
+                finally:
+                    sys.stdout, sys.stderr = stdout, stderr
+                    os.chdir(cwd)
+                    if 'matplotlib.pyplot' in sys.modules:
+                        sys.modules['matplotlib.pyplot'].close('all')
+
+                try:
+                    conn.send(result + (output.getvalue(),))
+                except (OSError, EOFError):
+                    pass
+                print('[{}] {} {}: {:.2f} [sec], {} hits, {} misses, {:.1f} MB'.format(
+                    time.strftime('%H:%M:%S'), message[0], result[0],
+                    time.time() - t0, cache.hits, cache.misses,
+                    cache.nbytes() / 1024**2))
+                sys.stdout.flush()
+    finally:
+        listener.close()
+        for fname in (address, key_file(address)):
+            if os.path.lexists(fname):
+                os.remove(fname)
+
+
+def request(address, name, args=()):
+    '''
+    Send the request "name" with "args" to the server on "address" from the
+    current directory. Returns the result and the output of the server,
+    raises RuntimeError if the request fails, OSError if no server is
+    running and PermissionError if the socket or its key is not owned by the
+    current user, so that no other user can answer with a pickle.
+    '''
+    from multiprocessing.connection import Client
+    from multiprocessing import AuthenticationError
+
+    authkey = read_authkey(address)
+    try:
+        conn = Client(address, family='AF_UNIX', authkey=authkey)
+    except AuthenticationError as e:
+        raise PermissionError('The server on "%s" failed to authenticate: %s'
+                              % (address, e))
+    with conn:
+        conn.send((name, os.getcwd(), args))
+        status, result, output = conn.recv()
+
+    if status != 'ok':
+        raise RuntimeError(output.rstrip() or result)
+
+    return result, output
+
+
+class RemoteProcar(object):
+    '''
+    The procar object of "inf" in the server on "address", e.g.
+
+        pro = RemoteProcar(default_address('npdos'), 'PROCAR')
+        x, y = pro.get_pdos(atoms='0:4', spd='4:9')
+
+    where the methods are called in the server, "kwargs" are those of the
+    procar class of the tool, e.g. "lsoc".
+    '''
+
+    def __init__(self, address, inf='PROCAR', **kwargs):
+        self._address = address
+        self._inf     = os.path.abspath(inf)
+        self._kwargs  = kwargs
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*a, **kw):
+            return request(self._address, 'call',
+                           (self._inf, self._kwargs, method, a, kw))[0]
+        return call
@@ -9,7 +9,8 @@ setup(
         author       = "Qijing Zheng",
         author_email = "zqj.kaka@gmail.com",
         url          = 'https://github.com/QijingZheng/VaspBandUnfolding',
-        py_modules   = [],
+        py_modules   = ["vaspio", "smearing", "batchrun",
+                        "procarserver", "structops"],
         scripts      = [
             "aseconv.py",
             "energy_unit_conv.py",
@@ -21,6 +22,7 @@ setup(
             "plot_workfunc.py",
             "velInit.py",
             "xcell.py",
+            "xpipe.py",
             "xtraj.py",
             "npband",
             "npdos",
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Broadening of the Kohn-Sham energies into density of states, shared by pydos,
+npband and npdos.
+'''
+
+from __future__ import division
+
+import numpy as np
+
+############################################################
+# Memory budget of the temporary arrays in the broadening, in bytes
+SMEARING_MEMORY = 64 * 1024**2
+
+# Gaussian kernel is truncated beyond this number of sigma. The neglected tail
+# is smaller than exp(-12.5) ~ 4E-6 of the peak value.
+GAUSSIAN_CUTOFF = 5.0
+
+# In the histogram method, the energies are binned on a grid finer than this
+# fraction of sigma. The discretization error is of the order of the square of
+# the ratio, smaller than 1E-3 of the peak value.
+HISTOGRAM_BINS_PER_SIGMA = 20
+############################################################
+
+
+def lorentz_smearing(x, x0, sigma=0.03):
+    '''
+    Lorentz smearing of a Delta function.
+    '''
+    return sigma / np.pi / ((x-x0)**2 + sigma**2)
+
+
+def gaussian_smearing_org(x, x0, sigma=0.05):
+    '''
+    Gaussian smearing of a Delta function.
+    '''
+
+    return 1. / (np.sqrt(2*np.pi) * sigma) * np.exp(-(x - x0)**2 / (2*sigma**2))
+
+
+SMEARING_KERNELS = {
+    'gaussian': gaussian_smearing_org,
+    'lorentz' : lorentz_smearing,
+}
+
+
+def broadening(xen, ens, whts, sigma=0.05, kernel='gaussian', cutoff=None,
+               memory=SMEARING_MEMORY, method='direct'):
+    '''
+    Broaden the energies "ens" on the equally spaced energy grid "xen".
+
+    xen   : energy grid of shape (nedos,)
+    ens   : energies of any shape, e.g. (nkpts, nbands)
+    whts  : weights of each energy, of shape ens.shape, or (nset,) + ens.shape
+            for several sets of weights sharing the same energies, e.g. the
+            total DOS and a few PDOS.
+    sigma : broadening parameter
+    kernel: "gaussian" or "lorentz"
+    cutoff: the kernel is truncated beyond "cutoff * sigma", default to 5 for
+            Gaussian and no truncation for Lorentzian, whose tail decays
+            slowly.
+    memory: budget of the temporary arrays in bytes
+    method: "direct" or "fft", the latter calls histogram_broadening
+
+    returns the broadened DOS of shape (nedos,) or (nset, nedos).
+
+    Each energy only contributes to the grid points within its truncation
+    window. The energies are processed in batches whose size is limited by the
+    memory budget, and the contributions are accumulated with np.bincount, so
+    that no array of shape (nkpts, nbands, nedos) is ever created.
+    '''
+    assert kernel in SMEARING_KERNELS, \
+        'Smearing kernel should be one of %s' % list(SMEARING_KERNELS.keys())
+    assert method in ['direct', 'fft'], \
+        'Broadening method should be "direct" or "fft"'
+    if method == 'fft':
+        return histogram_broadening(xen, ens, whts, sigma, kernel, cutoff)
+    func = SMEARING_KERNELS[kernel]
+
+    xen  = np.asarray(xen, dtype=float)
+    ens  = np.asarray(ens, dtype=float)
+    whts = np.asarray(whts, dtype=float)
+    single = whts.shape == ens.shape
+    ens  = ens.ravel()
+    whts = whts.reshape((-1, ens.size))
+    nset  = whts.shape[0]
+    nedos = xen.size
+
+    if cutoff is None:
+        cutoff = GAUSSIAN_CUTOFF if kernel == 'gaussian' else np.inf
+
+    dx = (xen[-1] - xen[0]) / (nedos - 1) if nedos > 1 else 1.0
+    if np.isfinite(cutoff):
+        # number of grid points in the window [x0 - cutoff, x0 + cutoff]
+        nwin = min(int(np.ceil(2 * cutoff * sigma / dx)) + 2, nedos)
+    else:
+        nwin = nedos
+    offsets = np.arange(nwin)
+
+    # temporary arrays of shape (nbatch, nwin): index, energy difference,
+    # kernel and weighted kernel
+    nbatch = max(1, int(memory // (8 * nwin * 4)))
+
+    dos = np.zeros((nset, nedos), dtype=float)
+    for start in range(0, ens.size, nbatch):
+        x0 = ens[start:start+nbatch]
+
+        # the first grid point of the window
+        lo = np.floor((x0 - cutoff * sigma - xen[0]) / dx).astype(int) \
+            if nwin < nedos else np.zeros(x0.size, dtype=int)
+        lo = np.clip(lo, 0, nedos - nwin)
+        index = lo[:, np.newaxis] + offsets
+
+        dx0 = xen[index] - x0[:, np.newaxis]
+        smear = func(dx0, 0.0, sigma)
+        if nwin < nedos:
+            smear[np.abs(dx0) >= cutoff * sigma] = 0.0
+
+        index = index.ravel()
+        for iset in range(nset):
+            dos[iset] += np.bincount(
+                index,
+                weights=(whts[iset, start:start+nbatch, np.newaxis] *
+                         smear).ravel(),
+                minlength=nedos
+            )
+
+    return dos[0] if single else dos
+
+
+def histogram_broadening(xen, ens, whts, sigma=0.05, kernel='gaussian',
+                         cutoff=None):
+    '''
+    Broaden the energies "ens" on the equally spaced energy grid "xen" by
+    binning them on a fine grid and convolving the histogram with the kernel
+    by FFT. The arguments and the returned values are the same as those of
+    "broadening".
+
+    The cost is O(N + M log M) for N energies and M grid points instead of
+    O(N x M). Each energy is shared linearly between its two neighbouring bins,
+    which are finer than sigma / HISTOGRAM_BINS_PER_SIGMA. The result differs
+    from the direct summation of gaussian_smearing_org by less than 1E-3 of the
+    peak value. As in "broadening", the energies within "cutoff * sigma" of the
+    grid, all of them for Lorentzian by default, contribute to it: the fine
+    grid is extended to them and cropped after the convolution.
+    '''
+    assert kernel in SMEARING_KERNELS, \
+        'Smearing kernel should be one of %s' % list(SMEARING_KERNELS.keys())
+    func = SMEARING_KERNELS[kernel]
+
+    xen  = np.asarray(xen, dtype=float)
+    ens  = np.asarray(ens, dtype=float)
+    whts = np.asarray(whts, dtype=float)
+    single = whts.shape == ens.shape
+    ens  = ens.ravel()
+    whts = whts.reshape((-1, ens.size))
+    nset  = whts.shape[0]
+    nedos = xen.size
+
+    if cutoff is None:
+        cutoff = GAUSSIAN_CUTOFF if kernel == 'gaussian' else np.inf
+
+    # the fine grid contains all the points of "xen"
+    dx = (xen[-1] - xen[0]) / (nedos - 1) if nedos > 1 else sigma
+    nsub = max(1, int(np.ceil(dx * HISTOGRAM_BINS_PER_SIGMA / sigma)))
+    dx /= nsub
+
+    # extended by the padding to the energies whose kernel reaches the grid
+    emin = max(ens.min(), xen[0] - cutoff * sigma) if ens.size else xen[0]
+    emax = min(ens.max(), xen[-1] + cutoff * sigma) if ens.size else xen[-1]
+    nlo = max(0, int(np.ceil((xen[0] - emin) / dx)))
+    nhi = max(0, int(np.ceil((emax - xen[-1]) / dx)))
+    nfine = nlo + (nedos - 1) * nsub + 1 + nhi
+
+    # linear binning
+    pos = (ens - xen[0]) / dx + nlo
+    inside = (pos >= 0) & (pos <= nfine - 1)
+    pos = pos[inside]
+    lo = np.minimum(np.floor(pos).astype(int), nfine - 2) \
+        if nfine > 1 else np.zeros(pos.size, dtype=int)
+    frac = pos - lo
+
+    # zero padded to avoid the wrap-around of the circular convolution
+    nfft = 2 * nfine
+    # kernel at the grid offsets 0, 1, ..., nfine - 1, -(nfine - 1), ..., -1
+    offsets = np.fft.fftfreq(nfft, 1.0 / nfft)
+    fkern = np.fft.rfft(func(offsets * dx, 0.0, sigma))
+
+    dos = np.zeros((nset, nedos), dtype=float)
+    for iset in range(nset):
+        w = whts[iset, inside]
+        hist = np.bincount(lo, weights=w * (1 - frac), minlength=nfine + 1)
+        hist += np.bincount(lo + 1, weights=w * frac, minlength=nfine + 1)
+        conv = np.fft.irfft(np.fft.rfft(hist[:nfine], nfft) * fkern, nfft)
+        dos[iset] = conv[nlo:nlo + (nedos - 1) * nsub + 1:nsub]
+
+    return dos[0] if single else dos
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Structure editing operations on ASE Atoms objects, shared by xcell.py,
+kut.py, molAdd.py and the in-process pipeline xpipe.py.
+'''
+
+from __future__ import print_function, division
+
+import io
+import numpy as np
+
+
+def symbol_order(atoms):
+    '''
+    The chemical symbols of "atoms" in the order of their first appearance.
+    '''
+    numbers = atoms.numbers
+    if numbers.size == 0:
+        return []
+    _, first = np.unique(numbers, return_index=True)
+    symbols = atoms.get_chemical_symbols()
+
+    return [symbols[ii] for ii in np.sort(first)]
+
+
+def sort_index(atoms, chem_sym_order=None, sort_pos=True, decimals=4):
+    '''
+    The indices rearranging "atoms" in the order of the chemical symbols
+    "chem_sym_order", default to the order of their first appearance, and
+    within each species by the z, y and x coordinates rounded to "decimals",
+    if "sort_pos". One lexsort with the rank of the species as the primary
+    key, i.e. the same as sorting by the coordinates and then regrouping the
+    atoms species by species.
+    '''
+    from ase.data import atomic_numbers
+
+    if chem_sym_order is None:
+        chem_sym_order = symbol_order(atoms)
+    assert set(atoms.get_chemical_symbols()) <= set(chem_sym_order)
+
+    rank = np.zeros(max(atomic_numbers.values()) + 1, dtype=int)
+    rank[[atomic_numbers[ss] for ss in chem_sym_order]] = np.arange(len(chem_sym_order))
+    keys = [rank[atoms.numbers]]
+    if sort_pos:
+        rpos = np.round(atoms.positions, decimals)
+        keys = [rpos[:, 0], rpos[:, 1], rpos[:, 2]] + keys
+
+    return np.lexsort(keys)
+
+
+def sort_atoms(atoms, chem_sym_order=None, sort_pos=True):
+    '''
+    "atoms" rearranged by "sort_index".
+    '''
+    return atoms[sort_index(atoms, chem_sym_order, sort_pos)]
+
+
+def write_poscar(fname, atoms, label=None, direct=True):
+    '''
+    Write "atoms" to the POSCAR "fname" in VASP5 format, with "label" as the
+    comment line instead of the chemical symbols written by ASE.
+    '''
+    from ase.io import write
+
+    fd = io.StringIO()
+    write(fd, atoms, format='vasp', vasp5=True, direct=direct)
+    content = fd.getvalue()
+    if label is not None:
+        content = label + content[content.index('\n'):]
+    with open(fname, 'w') as out:
+        out.write(content)
+
+
+def poscar_label(fname):
+    '''
+    The comment line of the POSCAR "fname".
+    '''
+    with open(fname) as inp:
+        return inp.readline().strip()
+
+
+def find_natoms_layers(pos_z, layer_thickness):
+    '''
+    Cluster the atoms into layers by their coordinates "pos_z". The atoms are
+    sorted once, each layer starts at the lowest remaining atom and includes
+    the atoms below its start plus half of "layer_thickness", found by binary
+    search in the sorted coordinates, i.e. O(N log N) in total.
+    '''
+    natoms = pos_z.size
+    order = np.argsort(pos_z, kind='stable')
+    sorted_z = pos_z[order]
+
+    # index of the first atom of each layer in the sorted coordinates
+    starts = [0]
+    while starts[-1] < natoms:
+        starts.append(
+            max(np.searchsorted(sorted_z, sorted_z[starts[-1]] + layer_thickness/2.,
+                                side='left'),
+                starts[-1] + 1)
+        )
+
+    indices_for_layers = [np.sort(order[ii:jj])
+                          for ii, jj in zip(starts[:-1], starts[1:])]
+    natoms_per_layers = [len(ii) for ii in indices_for_layers]
+    n_atomic_layers = len(natoms_per_layers)
+
+    return n_atomic_layers, natoms_per_layers, indices_for_layers
+
+
+def layer_atoms(atoms, layers, layer_thickness=0.1, axis=2):
+    '''
+    The indices of the atoms in the atomic "layers" along "axis".
+    '''
+    n_atomic_layers, natoms_per_layers, indices_for_layers = \
+    find_natoms_layers(atoms.positions[:, axis], layer_thickness)
+
+    return np.array([ii for jj in range(n_atomic_layers)
+                        for ii in indices_for_layers[jj]
+                        if jj in layers], dtype=int)
+
+
+def symmetry_operations(atoms, symprec=1E-3):
+    '''
+    The operations of the space group of "atoms", i.e. the integer rotations
+    and the translations acting on the scaled positions as row vectors,
+    "s' = s M + t". spglib is used if available. Otherwise, the rotations are
+    searched among the matrices with elements in {-1, 0, 1} preserving the
+    metric of the Minkowski reduced cell, and the translations among those
+    mapping an atom of the rarest species onto the others.
+    '''
+    try:
+        import spglib
+        dataset = spglib.get_symmetry(
+            (atoms.cell[:], atoms.get_scaled_positions(), atoms.numbers),
+            symprec=symprec)
+        return (np.array([rot.T for rot in dataset['rotations']]),
+                np.array(dataset['translations']))
+    except ImportError:
+        pass
+
+    from itertools import product
+    from ase.geometry import minkowski_reduce
+
+    rcell, op = minkowski_reduce(atoms.cell[:], pbc=atoms.pbc)
+    metric = np.dot(rcell, rcell.T)
+    lengths = np.sqrt(np.diag(metric))
+    cands = np.array(list(product([-1, 0, 1], repeat=9))).reshape((-1, 3, 3))
+    ok = np.all(np.abs(
+        np.einsum('nij,jk,nlk->nil', cands, metric, cands) - metric
+    ) < symprec * np.add.outer(lengths, lengths), axis=(1, 2))
+    # the rotations in the original basis
+    iop = np.linalg.inv(op)
+    rots = np.rint(np.einsum('ij,njk,kl->nil', iop, cands[ok], op)).astype(int)
+
+    scaled = atoms.get_scaled_positions()
+    numbers = atoms.numbers
+    cell = atoms.cell[:]
+    species, counts = np.unique(numbers, return_counts=True)
+    rare = np.nonzero(numbers == species[np.argmin(counts)])[0]
+    # a few atoms spread over the cell are checked first, most of the trials
+    # fail on them
+    spread = np.lexsort(scaled.T)
+    first = spread[np.linspace(0, len(atoms) - 1, min(16, len(atoms))).astype(int)]
+
+    def maps(new, atoms_index):
+        # whether the atoms "atoms_index", in the columns of each row of "new",
+        # are on the atoms
+        diff = new[:, :, None, :] - scaled[None, None, :, :]
+        diff -= np.rint(diff)
+        dist = np.linalg.norm(np.dot(diff, cell), axis=-1)
+        dist[:, numbers[atoms_index, None] != numbers[None, :]] = np.inf
+        return np.all(dist.min(axis=2) < symprec, axis=1)
+
+    def find(rot, nmax=None):
+        # the translations of "rot", at most "nmax" of them
+        new = np.dot(scaled, rot)
+        found = []
+        chunk = max(1, 2**20 // (len(first) * len(atoms)))
+        for ii in range(0, len(rare), chunk):
+            trials = scaled[rare[ii:ii+chunk]] - new[rare[0]]
+            trials = trials[maps(new[None, first, :] + trials[:, None, :],
+                                 np.arange(len(first)))]
+            for trans in trials:
+                if maps(new[None, :, :] + trans, np.arange(len(atoms)))[0]:
+                    found.append(trans - np.floor(trans + symprec))
+                    if len(found) == nmax:
+                        return found
+        return found
+
+    # the pure translations, then the operations of the other rotations are
+    # one of their translations plus the pure ones
+    identity = np.eye(3, dtype=int)
+    pure = np.array(find(identity))
+    rotations, translations = [identity] * len(pure), list(pure)
+    for rot in rots:
+        if np.all(rot == identity):
+            continue
+        found = find(rot, 1)
+        if found:
+            trans = found[0] + pure
+            rotations.extend([rot] * len(pure))
+            translations.extend(trans - np.floor(trans + symprec))
+
+    return np.array(rotations), np.array(translations)
+
+
+def lattice_shifts(cell, pbc, cutoff):
+    '''
+    The integer lattice translations of the periodic directions "pbc" of
+    "cell" reaching the images within "cutoff" of the points in the cell.
+    '''
+    # the distance between the lattice planes is 1 / |b_i|
+    recip = np.linalg.norm(np.linalg.inv(cell), axis=0)
+    nmax = np.where(pbc, np.ceil(cutoff * recip).astype(int) + 1, 0)
+
+    return np.array(np.meshgrid(*[np.arange(-n, n + 1) for n in nmax],
+                                indexing='ij')).reshape((3, -1)).T
+
+
+def min_distances(points, atoms, cutoff):
+    '''
+    The distance of each of "points" to the nearest atom of "atoms" or its
+    periodic images, "inf" if larger than "cutoff". A KD-tree of the images is
+    used if scipy is available, otherwise the distances are computed in chunks
+    of points.
+    '''
+    shifts = np.dot(lattice_shifts(atoms.cell[:], atoms.pbc, cutoff),
+                    atoms.cell[:])
+    images = (atoms.positions[None, :, :] + shifts[:, None, :]).reshape((-1, 3))
+    points = np.asarray(points, dtype=float).reshape((-1, 3))
+    if images.size == 0:
+        return np.full(len(points), np.inf)
+
+    try:
+        from scipy.spatial import cKDTree
+        dist, _ = cKDTree(images).query(points, distance_upper_bound=cutoff)
+        return dist
+    except ImportError:
+        pass
+
+    dist = np.empty(len(points))
+    chunk = max(1, 2**22 // len(images))
+    for ii in range(0, len(points), chunk):
+        d = np.linalg.norm(points[ii:ii+chunk, None, :] - images[None, :, :],
+                           axis=-1).min(axis=1)
+        dist[ii:ii+chunk] = np.where(d < cutoff, d, np.inf)
+
+    return dist
+
+
+############################################################
+# The operations of the pipeline, each one returns the new Atoms object
+############################################################
+
+def supercell(atoms, size):
+    '''
+    The supercell of "size" along the three lattice vectors.
+    '''
+    return atoms * tuple(size)
+
+
+def cut(atoms, hkl, nlayer):
+    '''
+    The slab of "nlayer" layers with surface "hkl" of the bulk "atoms".
+    '''
+    from ase.build import surface
+
+    return surface(atoms, tuple(hkl), layers=nlayer)
+
+
+def delete_layers(atoms, layers, layer_thickness=0.1, axis=2):
+    '''
+    Remove the atomic "layers" along "axis".
+    '''
+    deleted = layer_atoms(atoms, layers, layer_thickness, axis)
+    kept = np.setdiff1d(np.arange(len(atoms)), deleted)
+
+    return atoms[kept]
+
+
+def fix_layers(atoms, layers, layer_thickness=0.1, axis=2):
+    '''
+    Fix the atoms in the atomic "layers" along "axis".
+    '''
+    from ase.constraints import FixAtoms
+
+    atoms = atoms.copy()
+    atoms.set_constraint(FixAtoms(
+        indices=layer_atoms(atoms, layers, layer_thickness, axis)))
+
+    return atoms
+
+
+def delete_atoms(atoms, indices):
+    '''
+    Remove the atoms of "indices", starting from 1 as in molDel.py, and
+    center the structure along z.
+    '''
+    deleted = np.asarray(indices, dtype=int) - 1
+    new = atoms[np.setdiff1d(np.arange(len(atoms)), deleted)]
+    new.center(axis=2)
+
+    return new
+
+
+def rotate_molecule(mol, rot):
+    '''
+    Rotate "mol" successively by the rotations in "rot", e.g. "z90" or "90"
+    around the z-axis.
+    '''
+    for za in rot:
+        if za[0].lower() in 'xyz':
+            axis = za[0].lower()
+            angle = za[1:]
+        else:
+            axis = 'z'
+            angle = za
+        try:
+            angle = float(angle)
+        except ValueError:
+            raise ValueError(
+                "Please enter valid rotation parameter, e.g. z90, not %s!" % za)
+        mol.rotate(angle, axis)
+
+
+def add_molecule(atoms, name, atom_index=0, height=1.0, mol_index=0,
+                 offset=(0.0, 0.0), rot=()):
+    '''
+    Add the molecule "name" of the g2 database with its atom "mol_index"
+    "height" above the atom "atom_index" of "atoms", as in molAdd.py, and
+    center the structure along z.
+    '''
+    from ase.build import molecule
+
+    mol = molecule(name, pbc=atoms.pbc, cell=atoms.cell)
+    mol.center()
+    rotate_molecule(mol, rot)
+
+    mol.positions += atoms.positions[atom_index] - mol.positions[mol_index]
+    mol.positions += [offset[0], offset[1], height]
+    new = atoms + mol
+    new.center(axis=2)
+
+    return new
+
+
+def set_vacuum(atoms, vacuum, axis=2):
+    '''
+    Center "atoms" with "vacuum" Angstrom of vacuum along "axis", which may be
+    a tuple of axes.
+    '''
+    atoms = atoms.copy()
+    atoms.center(vacuum=vacuum / 2., axis=axis)
+
+    return atoms
+
+
+# name: (function, whether it refers to the atom indices of the structure)
+OPERATIONS = {
+    'supercell'    : (supercell, False),
+    'cut'          : (cut, False),
+    'delete_layers': (delete_layers, False),
+    'fix'          : (fix_layers, False),
+    'delete'       : (delete_atoms, True),
+    'add'          : (add_molecule, True),
+    'vacuum'       : (set_vacuum, False),
+}
+
+# the operations acting on the atomic layers along the vacuum direction
+_LAYER_OPERATIONS = ('delete_layers', 'fix')
+
+
+def apply_pipeline(atoms, operations, chem_sym_order=None, sort_pos=True,
+                   layer_thickness=0.1, axis=2):
+    '''
+    Apply the "operations", a list of "(name, args)" of OPERATIONS, to
+    "atoms" in turn and rearrange the atoms as in "sort_atoms", in the order
+    of the chemical symbols "chem_sym_order", default to that of the input
+    followed by the species added by the operations.
+
+    The atoms are sorted once at the end, and before the operations referring
+    to the atom indices, e.g. "add", if the order has been changed since, so
+    that the indices are the same as those of the output of the separate
+    scripts.
+    '''
+    # by default, the species of the input then the added ones
+    order = list(chem_sym_order or symbol_order(atoms))
+
+    def _sort(atoms):
+        order.extend(ss for ss in symbol_order(atoms) if ss not in order)
+        return sort_atoms(atoms, order, sort_pos)
+
+    unsorted = False
+    for name, args in operations:
+        func, indexed = OPERATIONS[name]
+        if indexed and unsorted:
+            atoms = _sort(atoms)
+        if name in _LAYER_OPERATIONS:
+            atoms = func(atoms, *args, layer_thickness=layer_thickness,
+                         axis=axis)
+        elif name == 'vacuum':
+            atoms = func(atoms, *args, axis=axis)
+        else:
+            atoms = func(atoms, *args)
+        # fixing the atoms keeps the order
+        unsorted = unsorted or name != 'fix'
+
+    if unsorted:
+        atoms = _sort(atoms)
+
+    return atoms
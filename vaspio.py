@@ -0,0 +1,1653 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Readers of VASP output files shared by pyband, pydos, npband, npdos and
+xtraj.py.
+'''
+
+from __future__ import division
+
+import os
+import re
+import time
+import select
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+import numpy as np
+
+############################################################
+# Size of the binary chunks read from PROCAR at once
+PROCAR_CHUNK_SIZE = 32 * 1024**2
+
+# Size of the blocks read backward from the end of OUTCAR
+OUTCAR_BLOCK_SIZE = 1024**2
+
+# Size of the chunks of the volumetric data, e.g. LOCPOT, parsed at once
+GRID_CHUNK_SIZE = 4 * 1024**2
+
+# ASCII codes used in the line classification
+_NEWLINE = ord('\n')
+_SPACE   = ord(' ')
+_DOT     = ord('.')
+_MINUS   = ord('-')
+_DIGIT_0 = ord('0')
+_DIGIT_9 = ord('9')
+
+# Directory of the parsed-data cache, shared by all the calculations of the
+# user. By default "pyband" in $XDG_CACHE_HOME or ~/.cache, which can be
+# redirected to a shared scratch directory by the environment variable.
+CACHE_DIR_ENV  = 'PYBAND_CACHE_DIR'
+CACHE_DIRNAME  = 'pyband'
+# Upper limit of the cache directory size in MB, the least recently used
+# entries are removed beyond it.
+CACHE_SIZE_ENV = 'PYBAND_CACHE_SIZE'
+CACHE_SIZE     = 4096
+# Options of the readers that do not change the returned data, which are not
+# part of the cache key.
+CACHE_NEUTRAL_KWARGS = ['chunksize', 'jobs']
+############################################################
+
+
+def procar_header(inf='PROCAR'):
+    '''
+    Return the number of k-points, bands and ions in the PROCAR header.
+    '''
+    with open(inf, 'rb') as f:
+        f.readline()
+        line = f.readline().decode()
+
+    # when the band number is too large, there will be no space between ";" and
+    # the actual band number. A bug found by Homlee Guo.
+    # Here, #kpts, #bands and #ions are all integers
+    nkpts, nbands, nions = [
+        int(xx) for xx in
+        ''.join([c if c.isdigit() else ' ' for c in line]).split()
+    ]
+
+    return nkpts, nbands, nions
+
+
+def procar_norbitals(inf='PROCAR'):
+    '''
+    Return the number of orbitals in PROCAR, i.e. the number of columns in the
+    "ion      s     py ..." line without the "ion" and "tot" columns.
+    '''
+    with open(inf, 'rb') as f:
+        for line in f:
+            if line.startswith(b'ion'):
+                return len(line.split()) - 2
+
+    raise ValueError('No projection found in %s!' % inf)
+
+
+def _iter_chunks(inf, chunksize=PROCAR_CHUNK_SIZE, start=0, stop=None):
+    '''
+    Read the file in large binary chunks, each of which ends with a newline.
+    Only the bytes in the range [start, stop) are read, the whole file by
+    default.
+
+    The same buffer is reused for all the chunks, i.e. each chunk is only
+    valid until the next one is requested.
+    '''
+    buf = bytearray(chunksize)
+    nrest = 0
+    with open(inf, 'rb') as f:
+        f.seek(start)
+        nleft = None if stop is None else stop - start
+        while True:
+            end = len(buf) if nleft is None else min(len(buf), nrest + nleft)
+            with memoryview(buf) as view:
+                with view[nrest:end] as part:
+                    nread = f.readinto(part)
+            if nleft is not None:
+                nleft -= nread
+            if nread == 0:
+                if buf[:nrest].strip():
+                    buf[nrest:nrest+1] = b'\n'
+                    yield np.frombuffer(buf, dtype=np.uint8, count=nrest+1)
+                break
+            nread += nrest
+
+            ii = buf.rfind(b'\n', 0, nread)
+            if ii < 0:
+                # a line longer than the chunk, enlarge the buffer
+                nrest = nread
+                buf.extend(bytearray(len(buf)))
+                continue
+            yield np.frombuffer(buf, dtype=np.uint8, count=ii+1)
+
+            nrest = nread - ii - 1
+            buf[:nrest] = buf[ii+1:nread]
+
+
+def procar_blocks(inf='PROCAR', chunksize=PROCAR_CHUNK_SIZE, start=0):
+    '''
+    Byte offsets of the " k-point " lines in PROCAR, i.e. the start of each
+    k-point block, in the order of the file. Only the lines after the offset
+    "start" are searched.
+
+    Only a plain byte search is performed on the binary chunks, which is
+    limited by the reading speed of the file.
+    '''
+    return _find_all_in_file(inf, b'\n k-point ', chunksize, start) + 1
+
+
+def _find_all_in_file(inf, pattern, chunksize=PROCAR_CHUNK_SIZE, start=0):
+    '''
+    Offsets of all the occurrences of the bytes "pattern" after the offset
+    "start" of the file, the file is read forward in chunks of "chunksize"
+    bytes.
+    '''
+    noverlap = len(pattern) - 1
+
+    offsets = []
+    buf = bytearray(chunksize + noverlap)
+    nkeep = 0
+    pos = start
+    with open(inf, 'rb') as f:
+        f.seek(start)
+        while True:
+            with memoryview(buf) as view:
+                with view[nkeep:] as part:
+                    nread = f.readinto(part)
+            if nread == 0:
+                break
+            nread += nkeep
+
+            ii = buf.find(pattern, 0, nread)
+            while ii >= 0:
+                offsets.append(pos + ii)
+                ii = buf.find(pattern, ii + 1, nread)
+
+            # the tail of the chunk, which might contain part of the pattern
+            nkeep = min(noverlap, nread)
+            buf[:nkeep] = buf[nread-nkeep:nread]
+            pos += nread - nkeep
+
+    return np.array(offsets, dtype=np.int64)
+
+
+def outcar_ionic_steps(inf='OUTCAR', start=0):
+    '''
+    Byte offsets of the "LOOP+" lines in OUTCAR after the offset "start",
+    i.e. the end of each completed ionic step.
+    '''
+    return _find_all_in_file(inf, b'LOOP+', start=start)
+
+
+def _split_lines(buf):
+    '''
+    Find the start/end of each line in the byte buffer and the first
+    non-blank character of each line.
+
+    Only the first few characters of each line are examined, which is enough
+    for PROCAR where the ion index is right-aligned in a narrow field.
+    '''
+    ends = np.flatnonzero(buf == _NEWLINE)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    first = buf[starts]
+    for ii in range(1, 8):
+        blank = first == _SPACE
+        if not np.any(blank):
+            break
+        first[blank] = buf[np.minimum(starts[blank] + ii, ends[blank])]
+
+    return starts, ends, first
+
+
+def _decode_fixed(rows, fields):
+    '''
+    Decode the fixed-width numbers in the rows, a 2D array of characters,
+    where "fields" are the positions of the decimal points of the wanted
+    columns.
+
+    Values are rebuilt from their digits with integer arithmetic, which is an
+    order of magnitude faster than text to float conversion. None is returned
+    if any of the rows does not match the layout of the first row, in which
+    case the caller should fall back to the generic conversion.
+    '''
+    width = rows.shape[1]
+
+    # number of decimals, e.g. 3 for format F6.3
+    ndec = 0
+    while (fields[0] + ndec + 1 < width and
+           _DIGIT_0 <= rows[0, fields[0] + ndec + 1] <= _DIGIT_9):
+        ndec += 1
+    if ndec == 0 or fields[0] < 3 or fields[-1] + ndec >= width:
+        return None
+
+    step = fields[1] - fields[0] if fields.size > 1 else 1
+    if np.all(np.diff(fields) == step):
+        # equally spaced columns, strided views instead of copies
+        def column(offset):
+            return rows[:, fields[0]+offset:fields[-1]+offset+1:step]
+    else:
+        def column(offset):
+            return rows[:, fields + offset]
+
+    # the characters around the decimal points are "sTO.DDD", where "s" might
+    # be the minus sign, "T" the tens, "O" the ones and "D" the decimals
+    if (np.any(column(0) != _DOT) or np.any(column(-3) >= _DIGIT_0)):
+        return None
+    tens = column(-2) - np.uint8(_DIGIT_0)
+    values = np.where(tens <= 9, tens, 0).astype(np.int32)
+    for ii in [-1] + list(range(1, ndec + 1)):
+        digits = column(ii) - np.uint8(_DIGIT_0)
+        if np.any(digits > 9):
+            return None
+        values *= 10
+        values += digits
+
+    negative = ((rows[:, fields - 2] == _MINUS) |
+                (rows[:, fields - 3] == _MINUS))
+    values[negative] *= -1
+
+    return values / 10.0**ndec
+
+
+def _decode_rows(buf, starts, ends, selected, ncols, columns):
+    '''
+    Convert the selected rows of PROCAR into an array of shape
+    (nrows, len(columns)), where "starts" and "ends" are the positions of all
+    the lines in the buffer and "selected" the mask of the wanted lines.
+    '''
+    # all the numeric rows together, the newlines are kept as separators
+    text = buf[np.repeat(selected, np.r_[starts[1:], buf.size] - starts)]
+    starts = starts[selected]
+    ends = ends[selected]
+
+    width = ends[0] - starts[0]
+    if np.all(ends - starts == width):
+        rows = text.reshape((-1, width + 1))
+        dots = np.flatnonzero(rows[0] == _DOT)
+        # the ion index is the only column without a decimal point
+        if dots.size == ncols - 1:
+            values = _decode_fixed(rows, dots[columns - 1])
+            if values is not None:
+                return values
+
+    # generic and slower conversion
+    try:
+        values = np.array(text.tobytes().split(), dtype=float)
+    except ValueError:
+        values = None
+    if values is None or values.size != starts.size * ncols:
+        raise ValueError('Unrecognized data rows in PROCAR!')
+
+    return values.reshape((-1, ncols))[:, columns]
+
+
+def _band_energies(buf, starts, ends):
+    '''
+    Extract the band energies from the lines of the form
+
+        band   1 # energy  -12.59193244 # occ.  2.00000000
+    '''
+    line = buf[starts[0]:ends[0]].tobytes()
+    ii = line.find(b'energy') + len(b'energy')
+    jj = line.find(b'#', ii)
+
+    # all the energies are in the same fixed-width field
+    if (ii >= len(b'energy') and jj > ii and
+        np.all(buf[starts + jj] == ord('#')) and
+        np.all(buf[starts + ii - 1] == ord('y'))):
+        field = buf[starts[:, np.newaxis] + np.arange(ii, jj + 1)]
+        field[:, -1] = _SPACE
+        try:
+            energies = np.array(field.tobytes().split(), dtype=float)
+        except ValueError:
+            energies = None
+        if energies is not None and energies.size == starts.size:
+            return energies
+
+    return np.array([
+        float(buf[s:e].tobytes().split()[-4]) for s, e in zip(starts, ends)
+    ])
+
+
+def _parse_procar(inf, layout, out, start=0, stop=None, iblock=0,
+                  chunksize=PROCAR_CHUNK_SIZE):
+    '''
+    Parse the k-point blocks of PROCAR in the byte range [start, stop), the
+    first of which is the "iblock"-th k-point block of the file, into the
+    arrays of "out", see "read_procar" for the meaning of the items of
+    "layout" and "out".
+
+    The arrays are grown in place when the spin-down blocks are met, unless
+    they are already large enough, e.g. memory-mapped arrays shared by the
+    processes of a parallel reading.
+
+    returns the numbers of the data rows, k-points and bands parsed.
+    '''
+    nkpts, nbands, nions = layout['nkpts'], layout['nbands'], layout['nions']
+    ncomp, comps = layout['ncomp'], layout['comps']
+    ion_pos, nions_kept = layout['ion_pos'], layout['nions_kept']
+    ncols, columns = layout['ncols'], layout['columns']
+    nlmax = columns.size
+
+    eband, kptw, kptv, proj = out['eband'], out['kptw'], out['kptv'], out['proj']
+    nspin = eband.shape[0]
+
+    # number of rows actually kept for each spin
+    nkept_per_spin = nkpts * nbands * len(comps) * nions_kept
+    # global row/k-point/band counters
+    irow0  = iblock * nbands * ncomp * nions
+    iband0 = iblock * nbands
+    irow, ikpt, iband = irow0, iblock, iband0
+    for buf in _iter_chunks(inf, chunksize, start, stop):
+        starts, ends, first = _split_lines(buf)
+
+        # k-points, only a small fraction of all the lines
+        for ii in np.flatnonzero(first == ord('k')):
+            line = buf[starts[ii]:ends[ii]].tobytes()
+            if not line.lstrip().startswith(b'k-point'):
+                continue
+            if ikpt // nkpts >= nspin:
+                nspin += 1
+                eband.resize((nspin, nkpts, nbands), refcheck=False)
+                kptw.resize((nspin, nkpts), refcheck=False)
+            head, tail = line.split(b':', 1)[-1].split(b'weight')
+            kptw.flat[ikpt] = float(tail.split(b'=')[-1])
+            if ikpt < nkpts:
+                vec = head.split()
+                if len(vec) != 3:
+                    # no space between negative numbers of format F11.8
+                    head = head.rstrip()
+                    vec = [head[-33:-22], head[-22:-11], head[-11:]]
+                kptv[ikpt] = [float(x) for x in vec]
+            ikpt += 1
+
+        # band energies
+        lines = np.flatnonzero(first == ord('b'))
+        if lines.size > 0:
+            if iband + lines.size > nspin * nkpts * nbands:
+                raise ValueError('Too many bands in PROCAR!')
+            eband.reshape(-1)[iband:iband+lines.size] = _band_energies(
+                buf, starts[lines], ends[lines]
+            )
+            iband += lines.size
+
+        isnum = (first >= _DIGIT_0) & (first <= _DIGIT_9)
+        if not np.any(isnum):
+            continue
+        rows = np.flatnonzero(isnum)
+
+        # global row index -> spin, k-point, band, component, ion
+        row_ids = irow + np.arange(rows.size)
+        irow += rows.size
+        if len(comps) != ncomp:
+            kept = (row_ids // nions) % ncomp == comps[0]
+            rows = rows[kept]
+            row_ids = row_ids[kept]
+            row_ids = (row_ids // (ncomp * nions)) * nions + row_ids % nions
+            if rows.size == 0:
+                continue
+        if ion_pos is not None:
+            pos = ion_pos[row_ids % nions]
+            kept = pos >= 0
+            rows = rows[kept]
+            row_ids = (row_ids[kept] // nions) * nions_kept + pos[kept]
+            if rows.size == 0:
+                continue
+        if row_ids[-1] >= nspin * nkept_per_spin:
+            if nspin > 1 or row_ids[-1] >= 2 * nkept_per_spin:
+                raise ValueError('Too many data rows in PROCAR, '
+                                 'SOC calculation without "lsorbit"?')
+            nspin += 1
+            eband.resize((nspin, nkpts, nbands), refcheck=False)
+            kptw.resize((nspin, nkpts), refcheck=False)
+        if proj.shape[0] < nspin:
+            proj.resize((nspin,) + proj.shape[1:], refcheck=False)
+
+        if (row_ids[-1] - row_ids[0] + 1 == row_ids.size and
+            np.all(np.diff(row_ids) == 1)):
+            row_ids = slice(row_ids[0], row_ids[-1] + 1)
+        selected = np.zeros(starts.size, dtype=bool)
+        selected[rows] = True
+        proj.reshape((-1, nlmax))[row_ids] = _decode_rows(
+            buf, starts, ends, selected, ncols, columns
+        )
+
+    return irow - irow0, ikpt - iblock, iband - iband0
+
+
+def _parse_procar_task(args):
+    '''
+    Parse a range of k-point blocks into the memory-mapped arrays in the
+    directory "dname", executed in the worker processes of "read_procar".
+    '''
+    inf, layout, dname, start, stop, iblock, chunksize = args
+
+    out = dict([
+        (name, np.load(os.path.join(dname, name + '.npy'), mmap_mode='r+'))
+        for name in ['eband', 'kptw', 'kptv', 'proj']
+    ])
+    counts = _parse_procar(inf, layout, out, start, stop, iblock, chunksize)
+    # the pages are written to the shared file mapping when unmapped
+    del out
+
+    return counts
+
+
+def _procar_layout(inf, lsorbit=False, component=None, ions=None,
+                   orbitals=None, total=False):
+    '''
+    The layout of PROCAR and the kept rows/columns, see "read_procar" for the
+    arguments. Returns a dictionary of the numbers of k-points, bands and ions
+    (nkpts, nbands, nions), the number of components (ncomp, 4 for SOC) and
+    the kept ones (comps), the position of each ion in the kept ions (ion_pos,
+    None for all of them) and their number (nions_kept), the number of columns
+    of the data rows (ncols) and the kept ones (columns).
+    '''
+    nkpts, nbands, nions = procar_header(inf)
+
+    ncomp = 4 if lsorbit else 1
+    if (component is not None) and lsorbit:
+        assert 0 <= component < 4
+        comps = [component]
+    else:
+        comps = list(range(ncomp))
+
+    # position of each ion in the kept ions, -1 for the skipped ones
+    if ions is None:
+        ion_pos = None
+        nions_kept = nions
+    else:
+        ions = np.asarray(ions, dtype=int).ravel()
+        if ions.size == 0 or ions.min() < 0 or ions.max() >= nions:
+            raise ValueError('Ion indices should be in the range [0, %d)!'
+                             % nions)
+        ion_pos = -np.ones(nions, dtype=int)
+        ion_pos[ions] = np.arange(ions.size)
+        nions_kept = ions.size
+
+    # skip the ion index and the "tot" columns
+    nlmax = procar_norbitals(inf)
+    columns = np.arange(1, nlmax + 1)
+    if total:
+        columns = np.array([nlmax + 1])
+    elif orbitals is not None:
+        columns = columns[np.asarray(orbitals, dtype=int).ravel()]
+
+    return dict(
+        nkpts=nkpts, nbands=nbands, nions=nions, ncomp=ncomp, comps=comps,
+        ion_pos=ion_pos, nions_kept=nions_kept, ncols=nlmax + 2,
+        columns=columns,
+    )
+
+
+def read_procar(inf='PROCAR', lsorbit=False, component=None,
+                ions=None, orbitals=None, dtype=np.float64,
+                chunksize=PROCAR_CHUNK_SIZE, jobs=1, total=False):
+    '''
+    Streaming PROCAR reader.
+
+    The file is read in large binary chunks and the data are written directly
+    into preallocated arrays, whose sizes are obtained from the header counts.
+    The text of PROCAR is never held in memory as a whole.
+
+    inf      : location of the PROCAR
+    lsorbit  : whether the PROCAR is from a SOC calculation
+    component: for SOC calculations, which of the four components (total, mx,
+               my, mz) to keep. None for all of them.
+    ions     : indices of the ions to keep, starting from 0. None for all of
+               them. The rows of the other ions are skipped without conversion.
+    orbitals : indices of the orbitals (s, py, pz, px, ...) to keep, None for
+               all of them.
+    total    : keep only the "tot" column written by VASP instead of the
+               orbitals, i.e. "nlmax" is 1. It differs from the sum of the
+               orbitals by the rounding of each column.
+    dtype    : data type of the projections, e.g. np.float32 to halve the
+               memory usage. See "SparseProjection" for the accuracy.
+    jobs     : number of processes, 0 for all the CPUs. With more than one
+               process, PROCAR is split at the " k-point " lines, found by
+               "procar_blocks", and each process parses a range of k-point
+               blocks into memory-mapped arrays in a temporary directory,
+               located by the environment variable TMPDIR.
+
+    returns:
+        eband : band energies of shape (nspin, nkpts, nbands)
+        kptw  : k-points weights of shape (nspin, nkpts)
+        kptv  : k-points vectors of shape (nkpts, 3)
+        proj  : projections of shape (nspin, nkpts, nbands, nions, nlmax) or
+                (nspin, nkpts, nbands, 4, nions, nlmax) for SOC calculations
+                with component=None. With "ions" or "orbitals", "nions" and
+                "nlmax" are the numbers of the selected ions and orbitals, in
+                the given order.
+    '''
+
+    assert os.path.isfile(inf), '%s cannot be found!' % inf
+    layout = _procar_layout(inf, lsorbit, component, ions, orbitals, total)
+    nkpts, nbands, nions = layout['nkpts'], layout['nbands'], layout['nions']
+    ncomp, comps = layout['ncomp'], layout['comps']
+    nions_kept, columns = layout['nions_kept'], layout['columns']
+
+    nrows_per_spin = nkpts * nbands * ncomp * nions
+    nkept_per_spin = nkpts * nbands * len(comps) * nions_kept
+
+    if jobs is None or jobs <= 0:
+        jobs = multiprocessing.cpu_count()
+    if jobs > 1:
+        offsets = procar_blocks(inf, chunksize)
+        nspin = offsets.size // nkpts
+    if jobs > 1 and nspin in [1, 2] and offsets.size == nspin * nkpts:
+        # the arrays are shared by the processes through the files
+        shapes = dict(
+            eband=((nspin, nkpts, nbands), float),
+            kptw=((nspin, nkpts), float),
+            kptv=((nkpts, 3), float),
+            proj=((nspin, nkept_per_spin, columns.size), dtype),
+        )
+        dname = tempfile.mkdtemp(prefix='procar-')
+        try:
+            for name, (shape, dt) in shapes.items():
+                np.lib.format.open_memmap(
+                    os.path.join(dname, name + '.npy'), mode='w+',
+                    dtype=dt, shape=shape
+                )
+
+            # a few ranges per process for a better load balance
+            blocks = [
+                bb for bb in
+                np.array_split(np.arange(offsets.size), 4 * jobs) if bb.size
+            ]
+            bounds = np.r_[offsets, os.path.getsize(inf)]
+            tasks = [
+                (inf, layout, dname, bounds[bb[0]], bounds[bb[-1] + 1],
+                 bb[0], chunksize)
+                for bb in blocks
+            ]
+            pool = multiprocessing.Pool(min(jobs, len(tasks)))
+            try:
+                counts = np.sum(pool.map(_parse_procar_task, tasks), axis=0)
+            finally:
+                pool.close()
+                pool.join()
+
+            eband, kptw, kptv, proj = [
+                np.load(os.path.join(dname, name + '.npy'))
+                for name in ['eband', 'kptw', 'kptv', 'proj']
+            ]
+        finally:
+            shutil.rmtree(dname, ignore_errors=True)
+    else:
+        # the data are first allocated for one spin, the spin-down block is
+        # appended when met, by growing the arrays in place.
+        nspin = 1
+        eband  = np.zeros((nspin, nkpts, nbands), dtype=float)
+        kptw   = np.zeros((nspin, nkpts), dtype=float)
+        kptv   = np.zeros((nkpts, 3), dtype=float)
+        proj   = np.zeros((nspin, nkept_per_spin, columns.size), dtype=dtype)
+        counts = _parse_procar(
+            inf, layout, dict(eband=eband, kptw=kptw, kptv=kptv, proj=proj),
+            chunksize=chunksize
+        )
+        nspin = eband.shape[0]
+
+    nrows, nk, nb = counts
+    if (nrows != nspin * nrows_per_spin or nk != nspin * nkpts or
+        nb != nspin * nkpts * nbands or proj.shape[0] != nspin):
+        raise ValueError('Incomplete PROCAR or inconsistent "lsorbit" setting!')
+
+    if len(comps) > 1:
+        proj.shape = (nspin, nkpts, nbands, ncomp, nions_kept, columns.size)
+    else:
+        proj.shape = (nspin, nkpts, nbands, nions_kept, columns.size)
+
+    return eband, kptw, kptv, proj
+
+
+class IncrementalProcar(object):
+    '''
+    Reader of a PROCAR that is still being written by a running calculation.
+
+    Each call of "update" only parses the k-point blocks appended since the
+    previous call: the byte offset of the first block that is not complete is
+    remembered and the file is read from there. A block is complete when the
+    next " k-point " line is written, or, for the last block of the file, when
+    all of its data rows are written; the latter is parsed again in the next
+    call, which costs one block. The arguments are those of "read_procar".
+    '''
+
+    def __init__(self, inf='PROCAR', lsorbit=False, component=None,
+                 ions=None, orbitals=None, dtype=np.float64,
+                 chunksize=PROCAR_CHUNK_SIZE, total=False):
+        self.inf = inf
+        self.options = dict(lsorbit=lsorbit, component=component,
+                            ions=ions, orbitals=orbitals, total=total)
+        self.dtype = dtype
+        self.chunksize = chunksize
+
+        self.layout = None
+        self.out = None
+        # offset and index of the first block that is not complete
+        self.offset = 0
+        self.iblock = 0
+        # number of complete blocks, including the last one of the file
+        self.ncomplete = 0
+
+    def _init_layout(self):
+        '''
+        Read the layout when the header and the first "ion" line are written.
+        '''
+        try:
+            layout = _procar_layout(self.inf, **self.options)
+        except ValueError:
+            return False
+
+        nkept_per_spin = (layout['nkpts'] * layout['nbands'] *
+                          len(layout['comps']) * layout['nions_kept'])
+        self.layout = layout
+        self.out = dict(
+            eband=np.zeros((1, layout['nkpts'], layout['nbands'])),
+            kptw=np.zeros((1, layout['nkpts'])),
+            kptv=np.zeros((layout['nkpts'], 3)),
+            proj=np.zeros((1, nkept_per_spin, layout['columns'].size),
+                          dtype=self.dtype),
+        )
+        return True
+
+    def update(self):
+        '''
+        Parse the new complete blocks, returns the number of them.
+        '''
+        if not os.path.isfile(self.inf):
+            return 0
+        if self.layout is None and not self._init_layout():
+            return 0
+        layout = self.layout
+        ncomplete = self.ncomplete
+
+        offsets = procar_blocks(self.inf, self.chunksize, self.offset)
+        if self.iblock > 0:
+            # the first incomplete block, whose " k-point " line is before
+            # the offset
+            offsets = np.r_[self.offset, offsets]
+        if offsets.size == 0:
+            return 0
+
+        # the blocks followed by another " k-point " line
+        if offsets.size > 1:
+            _parse_procar(self.inf, layout, self.out, offsets[0],
+                          offsets[-1], self.iblock, self.chunksize)
+            self.iblock += offsets.size - 1
+            self.offset = offsets[-1]
+            self.ncomplete = self.iblock
+
+        # the last block, up to the last complete line
+        with open(self.inf, 'rb') as fp:
+            stop = _rfind_in_file(fp, b'\n') + 1
+        if stop > self.offset:
+            try:
+                nrows, nk, nb = _parse_procar(
+                    self.inf, layout, self.out, self.offset, stop,
+                    self.iblock, self.chunksize
+                )
+            except ValueError:
+                nrows = nk = nb = 0
+            if (nk == 1 and nb == layout['nbands'] and nrows ==
+                    layout['nbands'] * layout['ncomp'] * layout['nions']):
+                self.ncomplete = self.iblock + 1
+
+        return self.ncomplete - ncomplete
+
+    def data(self):
+        '''
+        The data of the complete blocks, in the same form as returned by
+        "read_procar", None if there are none. While the first spin is
+        written, only its complete k-points are returned. While the second
+        spin is written, only the first spin is returned.
+        '''
+        if self.ncomplete == 0:
+            return None
+
+        layout = self.layout
+        nkpts = layout['nkpts']
+        if self.ncomplete <= nkpts:
+            nspin, nk = 1, self.ncomplete
+        elif self.ncomplete < 2 * nkpts:
+            nspin, nk = 1, nkpts
+        else:
+            nspin, nk = 2, nkpts
+
+        shape = (nspin, nkpts, layout['nbands'])
+        if len(layout['comps']) > 1:
+            shape += (layout['ncomp'],)
+        shape += (layout['nions_kept'], layout['columns'].size)
+
+        eband = self.out['eband'][:nspin, :nk].copy()
+        kptw = self.out['kptw'][:nspin, :nk].copy()
+        kptv = self.out['kptv'][:nk].copy()
+        proj = self.out['proj'][:nspin].reshape(shape)[:, :nk].copy()
+
+        return eband, kptw, kptv, proj
+
+
+def compact_selection(groups):
+    '''
+    For groups of indices, e.g. the atoms of each PDOS, return the sorted
+    union of the indices and the groups re-indexed into the union. None stands
+    for all the indices, in which case the union is None and the groups are
+    returned unchanged.
+
+    The union can be passed to "read_procar" as "ions" or "orbitals", so that
+    only the selected rows/columns are loaded.
+    '''
+    if any([g is None for g in groups]):
+        return None, groups
+
+    union = sorted(set([int(x) for g in groups for x in g]))
+    pos = dict([(x, ii) for ii, x in enumerate(union)])
+
+    return union, [[pos[int(x)] for x in g] for g in groups]
+
+
+def _rfind_in_file(fp, pattern, end=None, blocksize=OUTCAR_BLOCK_SIZE):
+    '''
+    Offset of the last occurrence of the bytes "pattern" before the offset
+    "end" of the binary file object "fp", -1 if not found. The file is read
+    backward in blocks of "blocksize" bytes, which overlap by len(pattern) - 1
+    bytes so that no occurrence is split between two blocks.
+    '''
+    if end is None:
+        fp.seek(0, os.SEEK_END)
+        end = fp.tell()
+
+    overlap = b''
+    while end > 0:
+        start = max(0, end - blocksize)
+        fp.seek(start)
+        buf = fp.read(end - start) + overlap
+        ii = buf.rfind(pattern)
+        if ii >= 0:
+            return start + ii
+        overlap = buf[:len(pattern) - 1]
+        end = start
+
+    return -1
+
+
+def _nonblank_lines(fp):
+    '''
+    Iterate over the non-blank lines of the binary file object "fp" from the
+    current position, decoded as str.
+    '''
+    for line in fp:
+        # the last line of a file being written might be incomplete
+        if line.strip() and line.endswith(b'\n'):
+            yield line.decode('ascii', 'replace')
+
+
+def read_outcar_bands(inf='OUTCAR', blocksize=OUTCAR_BLOCK_SIZE):
+    '''
+    Extract band energies from OUTCAR.
+
+    returns:
+        efermi: the Fermi energy
+        bands : band energies of shape (nspin, nkpts, nbands)
+        vkpts : k-points vectors of shape (nkpts, 3)
+        wkpts : k-points weights of shape (nkpts,)
+        bcell : reciprocal lattice vectors of shape (3, 3)
+
+    Only the parts of OUTCAR that are needed are read: the header is scanned
+    until the k-points list, the file is then searched backward from the end
+    for the last "E-fermi" and "reciprocal lattice vectors" lines, and the band
+    energies following the last "E-fermi" are parsed. The memory usage does
+    not depend on the length of OUTCAR, e.g. for long relaxations or MD runs.
+    '''
+
+    nkpts = ispin = kpts = None
+    with open(inf, 'rb') as fp:
+        ############################################################
+        # header: number of k-points, bands and spins, k-points list
+        ############################################################
+        lines = _nonblank_lines(fp)
+        for line in lines:
+            if 'NKPTS =' in line:
+                nkpts = int(line.split()[3])
+                nband = int(line.split()[-1])
+
+            if 'ISPIN  =' in line:
+                ispin = int(line.split()[2])
+
+            if "k-points in reciprocal lattice and weights" in line:
+                kpts = [next(lines).split() for ii in range(nkpts)]
+
+            if nkpts is not None and ispin is not None and kpts is not None:
+                break
+        else:
+            raise ValueError(
+                'NKPTS, ISPIN or the k-points list not found in %s!' % inf
+            )
+
+        # k-points vectors and weights
+        tmp = np.array(kpts, dtype=float)
+        vkpts = tmp[:, :3]
+        wkpts = tmp[:, -1]
+
+        ############################################################
+        # the last "E-fermi" and the last reciprocal lattice before it
+        ############################################################
+        iefermi = _rfind_in_file(fp, b'E-fermi', blocksize=blocksize)
+        if iefermi < 0:
+            raise ValueError('E-fermi not found in %s!' % inf)
+        ibasis = _rfind_in_file(fp, b'reciprocal lattice vectors',
+                                end=iefermi, blocksize=blocksize)
+        if ibasis < 0:
+            raise ValueError('Reciprocal lattice not found in %s!' % inf)
+
+        # basis vector of reciprocal lattice
+        # When the supercell is too large, spaces are missing between real
+        # space lattice constants. A bug found out by Wei Xie
+        # (weixie4@gmail.com).
+        fp.seek(ibasis)
+        lines = _nonblank_lines(fp)
+        next(lines)
+        B = np.array([next(lines).split()[-3:] for ii in range(3)],
+                     dtype=float)
+
+        ############################################################
+        # band energies following the last "E-fermi"
+        ############################################################
+        fp.seek(iefermi)
+        lines = _nonblank_lines(fp)
+        Efermi = float(next(lines).split()[2])
+
+        # for ispin = 2, there are two extra lines "spin component...", in
+        # VASP 6.2, there are extra lines containing "Fermi energy: xxxx"
+        bands = np.empty(ispin * nkpts * nband, dtype=float)
+        nread = 0
+        for line in lines:
+            if nread == bands.size:
+                break
+            if 'spin component' in line or 'band No.' in line:
+                continue
+            if 'Fermi energy:' in line:
+                continue
+            if 'k-point' in line:
+                continue
+            bands[nread] = float(line.split()[1])
+            nread += 1
+        else:
+            if nread < bands.size:
+                raise ValueError('Incomplete band energies in %s!' % inf)
+
+    bands = bands.reshape((ispin, nkpts, nband))
+
+    return Efermi, bands, vkpts, wkpts, B
+
+
+############################################################
+# On-disk cache of the parsed data
+############################################################
+
+def _cache_root():
+    '''
+    The cache directory, one for all the parsed files, so that its size
+    limit applies to the whole cache. The entries are keyed on the real path
+    of the files.
+    '''
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        root = os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'),
+            CACHE_DIRNAME
+        )
+    return root
+
+
+def _cache_size_limit():
+    '''
+    The upper limit of the cache directory size in bytes.
+    '''
+    try:
+        size = float(os.environ.get(CACHE_SIZE_ENV, CACHE_SIZE))
+    except ValueError:
+        size = CACHE_SIZE
+    return int(size * 1024**2)
+
+
+def _cache_keys(inf, reader, kwargs):
+    '''
+    Two keys of the cache entry: the first one identifies the file and the
+    reading options, the second one the state of the file, i.e. size and
+    modification time.
+    '''
+    path = os.path.realpath(inf)
+    stat = os.stat(path)
+    kwargs = [(k, v) for k, v in sorted(kwargs.items())
+              if k not in CACHE_NEUTRAL_KWARGS]
+
+    key1 = hashlib.sha1(repr(
+        (path, reader.__name__, kwargs)
+    ).encode()).hexdigest()[:16]
+    key2 = hashlib.sha1(repr(
+        (stat.st_size, stat.st_mtime_ns if hasattr(stat, 'st_mtime_ns')
+         else stat.st_mtime)
+    ).encode()).hexdigest()[:8]
+
+    return key1, key2
+
+
+def _dir_size(dname):
+    '''
+    Total size of the files in the directory.
+    '''
+    return sum(
+        os.path.getsize(os.path.join(dname, ff)) for ff in os.listdir(dname)
+    )
+
+
+def evict_cache(root, limit=None):
+    '''
+    Remove the least recently used entries in the cache directory until its
+    size is below the limit.
+    '''
+    if limit is None:
+        limit = _cache_size_limit()
+    if not os.path.isdir(root):
+        return
+
+    entries = []
+    for name in os.listdir(root):
+        dname = os.path.join(root, name)
+        if name.startswith('.') or not os.path.isdir(dname):
+            continue
+        try:
+            entries.append(
+                (os.path.getmtime(dname), _dir_size(dname), dname)
+            )
+        except OSError:
+            continue
+
+    total = sum([e[1] for e in entries])
+    for mtime, size, dname in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(dname, ignore_errors=True)
+        total -= size
+
+
+def _load_entry(dname):
+    '''
+    Load the arrays of one cache entry, memory-mapped in copy-on-write mode.
+    '''
+    with open(os.path.join(dname, 'nitem')) as f:
+        nitem = int(f.read())
+    items = []
+    for ii in range(nitem):
+        item = np.load(os.path.join(dname, '%d.npy' % ii), mmap_mode='c')
+        if item.ndim == 0:
+            item = item[()]
+        items.append(item)
+    return tuple(items)
+
+
+def _save_entry(dname, items):
+    '''
+    Write the arrays of one cache entry. The entry is written into a temporary
+    directory first and then renamed, so that a partially written entry is
+    never loaded.
+    '''
+    tmp = '%s.%d.tmp' % (dname, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        for ii, item in enumerate(items):
+            np.save(os.path.join(tmp, '%d.npy' % ii), np.asarray(item))
+        # written last, marks the entry as complete
+        with open(os.path.join(tmp, 'nitem'), 'w') as f:
+            f.write('%d' % len(items))
+        os.rename(tmp, dname)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_cached(reader, inf, cache=True, **kwargs):
+    '''
+    Call "reader(inf, **kwargs)" and store the returned arrays in an on-disk
+    cache, from which they are loaded in later calls with the same file and
+    options.
+
+    The cache entry is keyed on the real path of the file, its size and
+    modification time, the reader and its options (e.g. lsorbit). Entries of
+    the same file with a different size or modification time are removed
+    when the file is parsed again. The arrays are memory-mapped in
+    copy-on-write mode, i.e. modifications are never written back.
+    '''
+    if not cache:
+        return reader(inf, **kwargs)
+
+    root = _cache_root()
+    key1, key2 = _cache_keys(inf, reader, kwargs)
+    dname = os.path.join(root, '%s-%s' % (key1, key2))
+
+    if os.path.isfile(os.path.join(dname, 'nitem')):
+        try:
+            items = _load_entry(dname)
+            # the modification time of the entry is used for the eviction
+            os.utime(dname, None)
+            return items
+        except (IOError, OSError, ValueError):
+            shutil.rmtree(dname, ignore_errors=True)
+
+    items = reader(inf, **kwargs)
+
+    try:
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        # out-dated entries of the same file
+        for name in os.listdir(root):
+            if name.startswith(key1 + '-') and not name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        _save_entry(dname, items)
+        evict_cache(root)
+    except (IOError, OSError):
+        # a read-only directory, the cache is simply skipped
+        pass
+
+    return items
+
+
+############################################################
+# Compact storage of the projections
+############################################################
+
+# Number of KS states whose projections are converted to float64 at once in the
+# contraction
+CONTRACT_BLOCK_SIZE = 4096
+
+
+class SparseProjection(object):
+    '''
+    Compact storage of the projections of shape (..., nions, nlmax), e.g.
+    (nspin, nkpts, nbands, nions, nlmax), where only the (band, ion) rows with
+    non-zero projections are kept.
+
+    The rows are grouped by ions in a CSR-like layout:
+
+        data   : projections of the kept rows, shape (nrows, nlmax)
+        states : the flattened (spin, k-point, band) index of each row
+        indptr : rows of ion "i" are data[indptr[i]:indptr[i+1]]
+
+    As PROCAR prints the projections with three decimals, the rows below
+    "tol", which is 0 by default, are exactly zero and no information is lost.
+    With data type float32, the absolute error of each projection is below
+    3E-8; with float16, it is below 2.5E-4, i.e. half of the last printed
+    digit of PROCAR. The contraction is always accumulated in float64.
+    '''
+
+    def __init__(self, proj, dtype=np.float32, tol=0.0):
+        '''
+        Build the compact storage from the dense projections "proj".
+        '''
+        self.shape = proj.shape
+        self.dtype = np.dtype(dtype)
+        nions, nlmax = self.shape[-2:]
+        proj = proj.reshape((-1, nions, nlmax))
+
+        counts = np.zeros(nions, dtype=np.int64)
+        states = [[] for ii in range(nions)]
+        data   = [[] for ii in range(nions)]
+        # processed in blocks to bound the temporary memory
+        for start in range(0, proj.shape[0], CONTRACT_BLOCK_SIZE):
+            block = proj[start:start+CONTRACT_BLOCK_SIZE]
+            kept = np.any(np.abs(block) > tol, axis=-1)
+            for ion in range(nions):
+                ii = np.flatnonzero(kept[:, ion])
+                if ii.size == 0:
+                    continue
+                states[ion].append(ii + start)
+                data[ion].append(block[ii, ion].astype(self.dtype))
+                counts[ion] += ii.size
+
+        self.indptr = np.zeros(nions + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(counts)
+        self.states = np.concatenate(
+            [np.concatenate(x) for x in states if len(x) > 0] +
+            [np.zeros(0, dtype=np.int64)]
+        ).astype(np.int32 if proj.shape[0] < 2**31 else np.int64)
+        self.data = np.concatenate(
+            [np.concatenate(x) for x in data if len(x) > 0] +
+            [np.zeros((0, nlmax), dtype=self.dtype)]
+        )
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.states.nbytes + self.indptr.nbytes
+
+    def contract(self, masks):
+        '''
+        Contract the projections with the masks of shape (nsel, nions, nlmax),
+        returns the weights of shape (nsel,) + shape[:-2].
+        '''
+        nions, nlmax = self.shape[-2:]
+        nstates = int(np.prod(self.shape[:-2]))
+        whts = np.zeros((nstates, masks.shape[0]), dtype=float)
+        masks = np.asarray(masks, dtype=float)
+
+        for ion in range(nions):
+            if not np.any(masks[:, ion]):
+                continue
+            rows = slice(self.indptr[ion], self.indptr[ion + 1])
+            # the states are unique within the rows of one ion
+            whts[self.states[rows]] += np.dot(
+                self.data[rows].astype(float), masks[:, ion].T
+            )
+
+        return np.moveaxis(whts, -1, 0).reshape(
+            (masks.shape[0],) + self.shape[:-2]
+        )
+
+    def toarray(self):
+        '''
+        The dense projections in float64.
+        '''
+        nions, nlmax = self.shape[-2:]
+        proj = np.zeros((int(np.prod(self.shape[:-2])), nions, nlmax),
+                        dtype=float)
+        for ion in range(nions):
+            rows = slice(self.indptr[ion], self.indptr[ion + 1])
+            proj[self.states[rows], ion] = self.data[rows]
+
+        return proj.reshape(self.shape)
+
+
+def contract_projection(proj, masks):
+    '''
+    Contract the projections "proj" of shape (..., nions, nlmax), dense array
+    of any float type or SparseProjection, with the masks of shape
+    (nsel, nions, nlmax). Returns the weights of shape (nsel,) + proj.shape[:-2]
+    in float64.
+    '''
+    if isinstance(proj, SparseProjection):
+        return proj.contract(masks)
+
+    masks = np.asarray(masks, dtype=float)
+    nions, nlmax = proj.shape[-2:]
+    flat = proj.reshape((-1, nions, nlmax))
+    if proj.dtype == np.float64:
+        whts = np.tensordot(flat, masks, axes=([-2, -1], [1, 2]))
+    else:
+        # converted to float64 block by block, so that the accumulation is
+        # done in double precision without a full float64 copy
+        whts = np.empty((flat.shape[0], masks.shape[0]), dtype=float)
+        for start in range(0, flat.shape[0], CONTRACT_BLOCK_SIZE):
+            block = flat[start:start+CONTRACT_BLOCK_SIZE].astype(float)
+            whts[start:start+CONTRACT_BLOCK_SIZE] = np.tensordot(
+                block, masks, axes=([-2, -1], [1, 2])
+            )
+
+    return np.moveaxis(whts, -1, 0).reshape(
+        (masks.shape[0],) + proj.shape[:-2]
+    )
+
+
+############################################################
+# Text and binary files of the processed data, e.g. bands and DOS
+############################################################
+
+# Fields "%W.Df" of the row formats in "write_formatted"
+_FIXED_FIELD = re.compile(r'%(\d+)\.(\d+)f')
+
+
+def _format_fixed(x, width, ndec):
+    '''
+    Characters of the floats "x" formatted as "%{width}.{ndec}f", of shape
+    x.shape + (width,), built from the digits with integer arithmetic.
+
+    None is returned if any of the values is not finite, does not fit in the
+    width, or lies so close to a rounding tie that the rounding of the scaled
+    value might differ from that of the string formatting, in which case the
+    caller should fall back to the string formatting.
+    '''
+    scaled = x * 10.0**ndec
+    if ndec == 0 or not np.all(np.abs(scaled) < 2.0**52):
+        return None
+    rounded = np.rint(scaled)
+    if np.any(np.abs(np.abs(scaled - rounded) - 0.5) <=
+              4 * np.finfo(float).eps * np.abs(scaled)):
+        return None
+
+    mag = np.abs(rounded).astype(np.int64)
+    ipart = mag // 10**ndec
+    fpart = mag % 10**ndec
+    negative = np.signbit(x)
+
+    # number of digits of the integer part
+    ndigits = np.ones(x.shape, dtype=int)
+    while np.any(ipart >= 10**ndigits.max()):
+        ndigits += ipart >= 10**ndigits
+    if np.any(ndigits + negative + ndec + 1 > width):
+        return None
+
+    chars = np.full(x.shape + (width,), _SPACE, dtype=np.uint8)
+    chars[..., width - ndec - 1] = _DOT
+    for ii in range(ndec):
+        chars[..., width - 1 - ii] = _DIGIT_0 + fpart % 10
+        fpart //= 10
+    for ii in range(ndigits.max()):
+        pos = width - ndec - 2 - ii
+        chars[..., pos] = np.where(ii < ndigits, _DIGIT_0 + ipart % 10,
+                                   chars[..., pos])
+        ipart //= 10
+    # the minus sign before the first digit
+    chars = chars.reshape((-1, width))
+    neg = np.flatnonzero(negative)
+    chars[neg, width - ndec - 2 - ndigits.ravel()[neg]] = _MINUS
+
+    return chars.reshape(x.shape + (width,))
+
+
+def write_formatted(out, fmt, data, chunksize=2**20):
+    '''
+    Write the rows of the 2D array "data" to the text file object "out", each
+    row formatted by "fmt", e.g. "%8.4f %10.4f\\n". The output is the same as
+
+        for row in data:
+            out.write(fmt % tuple(row))
+
+    If "fmt" only consists of fixed-point fields "%W.Df" and literal text, the
+    characters of whole blocks of rows are built at once by "_format_fixed".
+    Otherwise, or for the blocks that do not fit in the fields, many rows are
+    formatted by a single string formatting. "chunksize" is the number of
+    values formatted at once.
+    '''
+    data = np.asarray(data, dtype=float)
+    nrows, ncols = data.shape
+
+    # layout of the row: positions of the fields and the literal text
+    tokens = _FIXED_FIELD.split(fmt)
+    literals = tokens[0::3]
+    widths = [int(x) for x in tokens[1::3]]
+    ndecs = [int(x) for x in tokens[2::3]]
+    fast = len(widths) == ncols and '%' not in ''.join(literals)
+    if fast:
+        template = []
+        starts = np.empty(ncols, dtype=int)
+        pos = 0
+        for ii in range(ncols):
+            template += [literals[ii], ' ' * widths[ii]]
+            starts[ii] = pos + len(literals[ii])
+            pos = starts[ii] + widths[ii]
+        template.append(literals[-1])
+        template = np.frombuffer(''.join(template).encode('ascii'),
+                                 dtype=np.uint8)
+        specs = sorted(set(zip(widths, ndecs)))
+        columns = [
+            np.flatnonzero((np.array(widths) == w) & (np.array(ndecs) == d))
+            for w, d in specs
+        ]
+
+    step = max(1, chunksize // max(1, ncols))
+    for start in range(0, nrows, step):
+        block = data[start:start+step]
+        if fast:
+            buf = np.tile(template, (block.shape[0], 1))
+            for (w, d), cols in zip(specs, columns):
+                chars = _format_fixed(block[:, cols], w, d)
+                if chars is None:
+                    break
+                buf[:, starts[cols][:, np.newaxis] + np.arange(w)] = chars
+            else:
+                out.write(buf.tobytes().decode('ascii'))
+                continue
+        out.write((fmt * block.shape[0]) % tuple(block.ravel().tolist()))
+
+
+HDF5_SUFFIXES = ['.h5', '.hdf5']
+
+
+def is_binary_file(fname):
+    '''
+    Whether "fname" is a binary file of "save_arrays", from its suffix.
+    '''
+    return os.path.splitext(fname)[1].lower() in ['.npz'] + HDF5_SUFFIXES
+
+
+def save_arrays(fname, **items):
+    '''
+    Save the arrays and the metadata, e.g. labels and energy reference, in
+    "items" to the binary file "fname". An HDF5 file is written if the suffix
+    is ".h5" or ".hdf5", which requires h5py, a ".npz" file otherwise. In HDF5
+    files, strings and lists of strings are stored as attributes of the root
+    group, the others as datasets.
+    '''
+    if os.path.splitext(fname)[1].lower() in HDF5_SUFFIXES:
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('h5py is required to write %s!' % fname)
+
+        with h5py.File(fname, 'w') as f:
+            for key, val in items.items():
+                if isinstance(val, str):
+                    f.attrs[key] = val
+                elif isinstance(val, (list, tuple)) and \
+                        all([isinstance(x, str) for x in val]):
+                    f.attrs.create(key, np.array(val, dtype=object),
+                                   dtype=h5py.string_dtype())
+                else:
+                    f.create_dataset(key, data=np.asarray(val))
+    else:
+        with open(fname, 'wb') as f:
+            np.savez(f, **dict([
+                (key, np.array(val, dtype=str)
+                 if isinstance(val, (list, tuple)) and
+                 all([isinstance(x, str) for x in val])
+                 else np.asarray(val))
+                for key, val in items.items()
+            ]))
+
+
+def load_arrays(fname):
+    '''
+    Load the items saved by "save_arrays" into a dictionary, where the scalars
+    are converted to Python numbers and the strings to (lists of) str.
+    '''
+    def convert(val):
+        val = np.asarray(val)
+        if val.dtype.kind in 'SUO':
+            val = val.astype(str)
+            return val.tolist()
+        if val.ndim == 0:
+            return val.item()
+        return val
+
+    items = {}
+    if os.path.splitext(fname)[1].lower() in HDF5_SUFFIXES:
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('h5py is required to read %s!' % fname)
+
+        with h5py.File(fname, 'r') as f:
+            for key, val in f.attrs.items():
+                items[key] = convert(val)
+            for key in f.keys():
+                items[key] = convert(f[key][()])
+    else:
+        with np.load(fname) as f:
+            for key in f.files:
+                items[key] = convert(f[key])
+
+    return items
+
+
+def read_outcar_efermi(inf='OUTCAR', blocksize=OUTCAR_BLOCK_SIZE):
+    '''
+    The last Fermi energy in OUTCAR, the file is searched backward from the
+    end.
+    '''
+    with open(inf, 'rb') as fp:
+        iefermi = _rfind_in_file(fp, b'E-fermi', blocksize=blocksize)
+        if iefermi < 0:
+            raise ValueError('E-fermi not found in %s!' % inf)
+        fp.seek(iefermi)
+        line = fp.readline().decode()
+
+    return float(line.split()[2])
+
+
+############################################################
+# Volumetric data, e.g. LOCPOT and CHGCAR
+############################################################
+
+def _grid_header(fp):
+    '''
+    Read the structure and the grid size at the beginning of the volumetric
+    data file "fp", opened in binary mode. Returns the cell and the grid size,
+    the file is positioned at the first value.
+    '''
+    fp.readline()
+    scale = float(fp.readline().split()[0])
+    cell = np.array([fp.readline().split()[:3] for ii in range(3)],
+                    dtype=float)
+    # a negative scaling factor is the volume of the cell
+    if scale < 0:
+        scale = (-scale / abs(np.linalg.det(cell)))**(1. / 3)
+    cell *= scale
+
+    counts = fp.readline().split()
+    # VASP 5 format with the element names
+    if not counts[0].isdigit():
+        counts = fp.readline().split()
+    natoms = sum([int(x) for x in counts])
+
+    # optional "Selective dynamics" line, then "Direct" or "Cartesian"
+    if fp.readline().strip()[:1] in [b's', b'S']:
+        fp.readline()
+    for ii in range(natoms):
+        fp.readline()
+
+    line = fp.readline()
+    while line and not line.strip():
+        line = fp.readline()
+    grid = tuple([int(x) for x in line.split()[:3]])
+    if len(grid) != 3:
+        raise ValueError('No grid size found in %s!' % fp.name)
+
+    return cell, grid
+
+
+def planar_average(inf='LOCPOT', axis=2, chunksize=GRID_CHUNK_SIZE):
+    '''
+    The average of the first volumetric data block of "inf", e.g. LOCPOT or
+    CHGCAR, over the planes perpendicular to the "axis"-th lattice vector.
+
+    returns:
+        cell   : the cell of shape (3, 3)
+        grid   : the grid size (NGX, NGY, NGZ)
+        average: the planar average of shape (grid[axis],)
+
+    The values, written in the Fortran order with a few values per line, are
+    parsed in chunks of "chunksize" bytes and accumulated into the average by
+    "np.bincount", so that the 3D grid is never held in memory. As in the
+    file, the values of CHGCAR are those of the density times the volume.
+    '''
+    with open(inf, 'rb') as fp:
+        cell, grid = _grid_header(fp)
+        ntotal = grid[0] * grid[1] * grid[2]
+        # the distance between the values of successive planes in the file
+        stride = [1, grid[0], grid[0] * grid[1]][axis]
+
+        average = np.zeros(grid[axis], dtype=float)
+        nread = 0
+        rest = b''
+        while nread < ntotal:
+            buf = fp.read(chunksize)
+            last = len(buf) == 0
+            buf = rest + buf
+            # the last number of the chunk might be incomplete
+            cut = len(buf) if last else \
+                max(buf.rfind(b' '), buf.rfind(b'\n')) + 1
+            # the values after the grid, e.g. the augmentation occupancies
+            # of CHGCAR, are not converted
+            values = np.array(buf[:cut].split()[:ntotal - nread], dtype=float)
+            rest = buf[cut:]
+            if values.size == 0 and last:
+                raise ValueError('Incomplete volumetric data in %s!' % inf)
+
+            iplane = (np.arange(nread, nread + values.size) // stride) % \
+                grid[axis]
+            average += np.bincount(iplane, weights=values,
+                                   minlength=grid[axis])
+            nread += values.size
+
+    return cell, grid, average / (ntotal // grid[axis])
+
+
+############################################################
+# Trajectories
+############################################################
+
+def _xdatcar_header(fp):
+    '''
+    Read the header of XDATCAR after its comment line, returns the
+    cell, the chemical symbols of the atoms, and the number of atoms.
+    '''
+    scale = float(fp.readline())
+    cell = np.array([fp.readline().split()[:3] for ii in range(3)],
+                    dtype=float) * scale
+    names = fp.readline().split()
+    if all([x.isdigit() for x in names]):
+        raise ValueError('No element names in the header of XDATCAR, '
+                         'VASP 5 format is required!')
+    counts = [int(x) for x in fp.readline().split()]
+    symbols = [n for n, c in zip(names, counts) for ii in range(c)]
+
+    return cell, symbols, len(symbols)
+
+
+def iter_xdatcar(inf='XDATCAR', start=0, stop=None, every=1):
+    '''
+    Iterate over the frames "start:stop:every" of XDATCAR, including the
+    variable-cell ones where the header is repeated before each frame.
+
+    Yields (cell, symbols, scaled_positions) of each frame, where "symbols" is
+    the list of chemical symbols of the atoms, shared by the frames of the
+    same header. The file is read line by line and only the selected frames
+    are parsed, the memory usage does not depend on the number of frames.
+    '''
+    assert start >= 0 and every >= 1 and (stop is None or stop >= 0), \
+        'Only non-negative start/stop and positive stride are supported!'
+
+    with open(inf) as fp:
+        cell = symbols = None
+        natoms = 0
+        iframe = 0
+        while stop is None or iframe < stop:
+            line = fp.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            if 'configuration' not in line:
+                cell, symbols, natoms = _xdatcar_header(fp)
+                continue
+            if symbols is None:
+                raise ValueError('No header before the frames of %s!' % inf)
+
+            selected = iframe >= start and (iframe - start) % every == 0
+            iframe += 1
+            if not selected:
+                for ii in range(natoms):
+                    fp.readline()
+                continue
+
+            lines = [fp.readline() for ii in range(natoms)]
+            pos = np.array(''.join(lines).split(), dtype=float)
+            if pos.size < natoms * 3:
+                # incomplete last frame
+                break
+            yield cell, symbols, pos.reshape((natoms, -1))[:, :3]
+
+
+############################################################
+# Files being written by a running calculation
+############################################################
+
+# Events of inotify(7): IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE
+_INOTIFY_MASK = 0x2 | 0x8 | 0x80 | 0x100
+
+
+def _inotify_watch(dirs):
+    '''
+    A non-blocking inotify file descriptor watching the directories "dirs",
+    None if inotify is not available, e.g. on other platforms than Linux.
+    '''
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+
+    for dname in dirs:
+        if libc.inotify_add_watch(fd, dname.encode(), _INOTIFY_MASK) < 0:
+            os.close(fd)
+            return None
+
+    return fd
+
+
+class FileWatcher(object):
+    '''
+    Wait for the modifications of files written by a running calculation.
+
+    The size and modification time of the files are checked every
+    "interval" seconds. On Linux, the directories of the files are also
+    watched by inotify, so that a modification is noticed without waiting for
+    the end of the interval. Either way, the process sleeps in between and the
+    CPU cost is negligible. The files on network file systems, where inotify
+    does not see the writes of other hosts, are still noticed by the periodic
+    check. A burst of writes is gathered into one change by waiting "settle"
+    seconds after the first event.
+    '''
+
+    def __init__(self, fnames, interval=2.0, settle=0.5):
+        self.fnames = list(fnames)
+        self.interval = interval
+        self.settle = min(settle, interval)
+        self._stat = {}
+
+        dirs = set([os.path.dirname(os.path.abspath(f)) for f in fnames])
+        self._fd = _inotify_watch(sorted(dirs))
+
+    def changed(self):
+        '''
+        The files that are modified since the previous call, all the existing
+        files in the first call.
+        '''
+        changed = []
+        for fname in self.fnames:
+            try:
+                st = os.stat(fname)
+                key = (st.st_size, st.st_mtime)
+            except OSError:
+                key = None
+            if key != self._stat.get(fname):
+                self._stat[fname] = key
+                if key is not None:
+                    changed.append(fname)
+
+        return changed
+
+    def wait(self):
+        '''
+        Block until any of the files is modified, returns the modified files.
+        '''
+        while True:
+            changed = self.changed()
+            if changed:
+                return changed
+
+            if self._fd is None:
+                time.sleep(self.interval)
+                continue
+            if select.select([self._fd], [], [], self.interval)[0]:
+                time.sleep(self.settle)
+                # discard the events, the files are checked by their stat
+                try:
+                    while os.read(self._fd, 65536):
+                        pass
+                except OSError:
+                    pass
+
+    def __iter__(self):
+        while True:
+            yield self.wait()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
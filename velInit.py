@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import argparse
 import ase
 import sys
@@ -9,6 +10,14 @@ from ase.io import read, write
 from ase.md.velocitydistribution import MaxwellBoltzmannDistribution, Stationary, ZeroRotation
 
 
+def format_velocities(vel):
+    '''
+    The velocity block appended to the POSCAR, formatted at once.
+    '''
+    vel = np.asarray(vel)
+    return '\n'.join(['%20.16f%20.16f%20.16f'] * len(vel)) % tuple(vel.ravel())
+
+
 def init_vel(cml):
     '''
     '''
@@ -17,9 +26,14 @@ def init_vel(cml):
     # read in the initial structure
     init_pos = read(arg.poscar)
 
+    if len(arg.temperature) > 1 or arg.nreplica is not None:
+        write_replicas(init_pos, arg)
+        return
+
     # set the momenta corresponding to T
     MaxwellBoltzmannDistribution(
-        init_pos, temperature_K=arg.temperature, force_temp=True
+        init_pos, temperature_K=arg.temperature[0], force_temp=True,
+        rng=None if arg.seed is None else np.random.default_rng(arg.seed)
     )
     # set the center-of-mass to 0
     Stationary(init_pos)
@@ -36,21 +50,119 @@ def init_vel(cml):
     # vel *= np.sqrt(arg.temperature / Tn)
     # init_pos.set_velocities(vel)
 
-    # write the structure
-    write(arg.out, init_pos, vasp5=True, direct=True)
-
     # units in VASP and ASE are different
     vel = init_pos.get_velocities() * ase.units.fs
+
+    # write the structure, the velocities are appended below, recent versions
+    # of ASE would also write the momenta
+    init_pos.set_momenta(None)
+    write(arg.out, init_pos, vasp5=True, direct=True)
+
     # np.savetxt('init_vel.dat', vel, fmt='%20.16f')
     # append the velocities to the POSCAR
     with open(arg.out, 'a+') as pos:
         pos.write('\n')
-        pos.write(
-            '\n'.join([
-                ''.join(["%20.16f" % x for x in row])
-                for row in vel
-            ])
-        )
+        pos.write(format_velocities(vel))
+
+
+def replica_velocities(atoms, temperatures, seeds, ndof, fixed=None):
+    '''
+    The Maxwell-Boltzmann velocities in Angstrom/fs of "atoms" for each of
+    the "seeds" and "temperatures", of shape (nseeds, ntemperatures, natoms,
+    3). One set of standard normals is drawn from the generator of each seed
+    and only scaled to each temperature, so that the velocities of a seed at a
+    temperature do not depend on the other seeds and temperatures. The drift
+    of the center of mass and the rotation are removed from all the replicas
+    at once. The directions fixed by "fixed", the flags of shape (natoms, 3)
+    along the cell vectors, are set to zero instead, as VASP does not remove
+    the drift with selective dynamics. Each replica is then scaled to its
+    temperature with "ndof" degrees of freedom, as counted by VASP.
+    '''
+    masses = atoms.get_masses()
+    temperatures = np.asarray(temperatures, dtype=float)
+    xi = np.array([
+        np.random.default_rng(seed).standard_normal((len(atoms), 3))
+        for seed in seeds
+    ])
+    vel = xi / np.sqrt(masses[None, :, None])
+
+    if fixed is None:
+        # set the center-of-mass to 0
+        vel -= (np.einsum('i,sij->sj', masses, vel) / masses.sum())[:, None, :]
+
+        # set the total angular momentum to 0, I w = L
+        pos = atoms.positions - atoms.get_center_of_mass()
+        inertia = np.einsum('i,ij,ik->jk', masses, pos, pos)
+        inertia = np.eye(3) * np.trace(inertia) - inertia
+        angmom = np.einsum('i,sij->sj', masses, np.cross(pos, vel))
+        omega = np.dot(angmom, np.linalg.pinv(inertia).T)
+        vel -= np.cross(omega[:, None, :], pos[None, :, :])
+    else:
+        # zero the fixed components along the cell vectors
+        cell = np.asarray(atoms.cell)
+        svel = np.dot(vel, np.linalg.inv(cell))
+        svel[:, fixed] = 0.0
+        vel = np.dot(svel, cell)
+
+    # scale to T
+    ekin = 0.5 * np.einsum('i,sij->s', masses, vel**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.sqrt(0.5 * ndof * ase.units.kB * temperatures[None, :]
+                        / ekin[:, None])
+    scale = np.where(np.isfinite(scale), scale, 0.0)
+    vel = vel[:, None, :, :] * scale[:, :, None, None]
+
+    # units in VASP and ASE are different
+    return vel * ase.units.fs
+
+
+def write_replicas(atoms, arg):
+    '''
+    Write the POSCARs with the initial velocities of all the replicas, i.e.
+    "arg.nreplica" seeds from "arg.seed" for each of "arg.temperature", to
+    "arg.outdir/T/seed/POSCAR", together with the Nose mass SMASS of each
+    temperature to "arg.outdir/smass.dat".
+    '''
+    from io import StringIO
+    from nose_mass import nose_mass, cnt_dof, fixed_flags
+
+    nreplica = arg.nreplica or 1
+    seed0 = 0 if arg.seed is None else arg.seed
+    seeds = list(range(seed0, seed0 + nreplica))
+    ndof = cnt_dof(atoms)
+
+    vel = replica_velocities(atoms, arg.temperature, seeds, ndof,
+                             fixed_flags(atoms))
+
+    # the structure is the same for all the replicas
+    buf = StringIO()
+    write(buf, atoms, format='vasp', vasp5=True, direct=True)
+    structure = buf.getvalue()
+
+    L = np.linalg.norm(atoms.cell, axis=1)[0]
+    smass = [nose_mass(T, ndof, arg.nose_time, L) for T in arg.temperature]
+
+    for jj, T in enumerate(arg.temperature):
+        for ii, seed in enumerate(seeds):
+            dname = os.path.join(arg.outdir, '{:g}K'.format(T),
+                                 '{:04d}'.format(seed))
+            if not os.path.isdir(dname):
+                os.makedirs(dname)
+            with open(os.path.join(dname, 'POSCAR'), 'w') as pos:
+                pos.write(structure)
+                pos.write('\n')
+                pos.write(format_velocities(vel[ii, jj]))
+
+    np.savetxt(os.path.join(arg.outdir, 'smass.dat'),
+               np.column_stack([arg.temperature, smass]),
+               fmt=['%10.2f', '%20.8f'],
+               header='T(K) SMASS, No. of degrees of freedom {}, '
+                      'oscillation time {:g} fs'.format(ndof, arg.nose_time))
+
+    print("{} replicas written to {}".format(len(seeds) * len(arg.temperature),
+                                              arg.outdir))
+    for T, Q in zip(arg.temperature, smass):
+        print("T = {:g} K: SMASS = {}".format(T, Q))
 
 
 def parse_cml_args(cml):
@@ -67,8 +179,20 @@ def parse_cml_args(cml):
                      help='Default output filename.')
     arg.add_argument('-t', '--temperature', dest='temperature',
                      action='store', type=float,
-                     default=300,
-                     help='The temperature.')
+                     default=[300], nargs='+',
+                     help='The temperature. Several temperatures for the replicas.')
+    arg.add_argument('-n', dest='nreplica', action='store', type=int,
+                     default=None,
+                     help='Number of replicas of each temperature, with the seeds from "--seed".')
+    arg.add_argument('--seed', dest='seed', action='store', type=int,
+                     default=None,
+                     help='The seed of the random velocities, the first one of the replicas, default to 0 for the replicas.')
+    arg.add_argument('--outdir', dest='outdir', action='store', type=str,
+                     default='replicas',
+                     help='Output directory of the replicas.')
+    arg.add_argument('-f', '--nose_time', dest='nose_time', action='store',
+                     type=float, default=40,
+                     help='The oscillation time in fs of the Nose thermostat of the replicas, see nose_mass.py.')
 
     return arg.parse_args(cml)
 
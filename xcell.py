@@ -3,7 +3,6 @@
 
 import numpy as np
 import sys, argparse
-from ase.io import read, write
 
 def parse_cml_args(cml):
     '''
@@ -36,6 +35,8 @@ def parse_cml_args(cml):
 
 def mk_supercell(cml):
     arg = parse_cml_args(cml)
+    from ase.io import read
+    from structops import sort_atoms, write_poscar, poscar_label
 
     pc = read(arg.poscar)
     sc = pc * arg.size
@@ -45,39 +46,17 @@ def mk_supercell(cml):
     if arg.vacuum:
         sc.center(vacuum=arg.vacuum / 2., axis='xyz'.index(arg.ivacuum))
 
-    org_atom_index = np.arange(len(sc), dtype=int)
-
-    # Sort first by z-coordinates then by y and x.
-    if arg.sort_pos:
-        rpos = np.round(sc.positions, 4)
-        new_atom_index = np.lexsort(
-                (rpos[:, 0], rpos[:, 1], rpos[:, 2])
-                )
-        sc = sc[new_atom_index]
-
-    # New order of chemical symbols
+    # Sort by the chemical symbols, in the new order or in the original one,
+    # then by z, y and x-coordinates.
     if arg.new_sym_order:
         assert set(arg.new_sym_order) == set(org_chem_symbols)
-        chem_sym_order = arg.new_sym_order
-    else:
-        # Just stick to the original order.
-        chem_sym_order = []
-        for ss in org_chem_symbols:
-            if not ss in chem_sym_order:
-                chem_sym_order.append(ss)
-
-    # Re-arrange the atoms according to the new order of chemical symbols
-    new_atom_index = [ii for ss in chem_sym_order
-                         for ii in org_atom_index[sc.symbols == ss]]
-    sc = sc[new_atom_index]
+    sc = sort_atoms(sc, arg.new_sym_order, arg.sort_pos)
 
     if arg.out:
-        write(arg.out, sc, vasp5=True, direct=True,
-              label=open(arg.poscar).readline().strip())
+        outF = arg.out
     else:
-        write('out_' + 'x'.join(["%d" % x for x in arg.size]) + '.vasp',
-              sc, vasp5=True, direct=True,
-              label=open(arg.poscar).readline().strip())
+        outF = 'out_' + 'x'.join(["%d" % x for x in arg.size]) + '.vasp'
+    write_poscar(outF, sc, label=poscar_label(arg.poscar))
 
 if __name__ == '__main__':
     mk_supercell(sys.argv[1:])
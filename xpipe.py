@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Apply a chain of structure editing operations, those of xcell.py, kut.py,
+molAdd.py and molDel.py, to the structures in one process, e.g.
+
+    xpipe.py -i POSCAR --cut 1 1 1 4 --delete-layers 0 --fix 0 1 \\
+             --vacuum 15 --add H2O 36 2.0 x60 -o out.vasp
+
+The operations are applied in the order of the command line to the structure
+in memory, which is sorted once and written at the end.
+'''
+
+import os
+import sys, argparse
+from time import time
+
+from structops import apply_pipeline, write_poscar, poscar_label
+
+
+class Operation(argparse.Action):
+    '''
+    Append the operation and its arguments to "ops", in the order of the
+    command line.
+    '''
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        ops = getattr(namespace, 'ops', None) or []
+        ops.append((self.dest, self.convert(parser, values)))
+        namespace.ops = ops
+
+    def convert(self, parser, values):
+        name = self.dest
+        try:
+            if name in ('supercell', 'cut'):
+                values = [int(x) for x in values]
+                if name == 'cut':
+                    return (values[:3], values[3])
+                return (values,)
+            elif name in ('delete_layers', 'fix', 'delete'):
+                return ([int(x) for x in values],)
+            elif name == 'add':
+                if len(values) < 2:
+                    raise ValueError('at least MOL and INDEX are required')
+                height = float(values[2]) if len(values) > 2 else 1.0
+                return (values[0], int(values[1]), height, 0,
+                        (0.0, 0.0), values[3:])
+            elif name == 'vacuum':
+                return (float(values),)
+        except ValueError as e:
+            parser.error('Invalid arguments of --%s: %s' % (
+                name.replace('_', '-'), e))
+
+
+def parse_cml_args(cml):
+    '''
+    CML parser.
+    '''
+    arg = argparse.ArgumentParser(add_help=True,
+        description='Apply the operations in the order of the command line.')
+
+    arg.add_argument('-i', dest='poscar', action='store', type=str,
+                     default=['POSCAR'], nargs='+',
+                     help='The input structures. For several ones, the output is written to the directory of each input, prefixed by the input name if several inputs share a directory.')
+    arg.add_argument('-o', dest='out', action='store', type=str,
+                     default='out.vasp',
+                     help='Default output filename.')
+    arg.add_argument('--supercell', dest='supercell', action=Operation,
+                     nargs=3, metavar=('NA', 'NB', 'NC'),
+                     help='Make the supercell, as xcell.py -s.')
+    arg.add_argument('--cut', dest='cut', action=Operation,
+                     nargs=4, metavar=('H', 'K', 'L', 'N'),
+                     help='Cut the slab of N layers with surface (hkl) of the bulk, as kut.py.')
+    arg.add_argument('--delete-layers', dest='delete_layers', action=Operation,
+                     nargs='+', metavar='LAYER',
+                     help='Delete the atomic layers, as kut.py -d.')
+    arg.add_argument('--fix', dest='fix', action=Operation,
+                     nargs='+', metavar='LAYER',
+                     help='Fix the atoms in the atomic layers, as kut.py -f.')
+    arg.add_argument('--delete', dest='delete', action=Operation,
+                     nargs='+', metavar='INDEX',
+                     help='Delete the atoms, the indices start from 1 as in molDel.py -a.')
+    arg.add_argument('--add', dest='add', action=Operation,
+                     nargs='+', metavar='ARG',
+                     help='"MOL INDEX [HEIGHT [ROT ...]]", add the molecule MOL HEIGHT above the atom INDEX, starting from 0, rotated by ROT, e.g. z90, as molAdd.py.')
+    arg.add_argument('--vacuum', dest='vacuum', action=Operation,
+                     metavar='LENGTH',
+                     help='Set new vacuum length.')
+    arg.add_argument('--ivacuum', dest='ivacuum', action='store', type=str,
+                     default='z', choices=['x', 'y', 'z'],
+                     help='Vacuum direction, also that of the atomic layers.')
+    arg.add_argument('-l', dest='layer_thickness', action='store', type=float,
+                     default=0.1,
+                     help='Default thickness of each atomic layer.')
+    arg.add_argument('-s', dest='new_sym_order', action='store',
+                     type=str, default=None, nargs='*',
+                     help='New order of the chemical symbols.')
+    arg.add_argument('--no-sort-pos', dest='sort_pos', action='store_false',
+                     help='Do not sort the coordinates.')
+
+    args = arg.parse_args(cml)
+    if not getattr(args, 'ops', None):
+        args.ops = []
+
+    return args
+
+
+def output_names(poscars, out):
+    '''
+    The output filenames of the input structures "poscars": "out" for a single
+    input, otherwise "out" in the directory of each input, prefixed by the
+    name of the input if several inputs are in the same directory. Raises
+    ValueError if two inputs are the same file.
+    '''
+    if len(poscars) == 1:
+        return [out]
+
+    names = [os.path.join(os.path.dirname(p), out) for p in poscars]
+    if len(set(map(os.path.realpath, names))) < len(names):
+        names = [os.path.join(os.path.dirname(p),
+                              '%s_%s' % (os.path.basename(p), out))
+                 for p in poscars]
+    real = [os.path.realpath(p) for p in poscars]
+    dups = sorted(set(p for p in real if real.count(p) > 1))
+    if dups:
+        raise ValueError('Duplicated input structures: %s' % ', '.join(dups))
+
+    return names
+
+
+def run_pipeline(cml):
+    '''
+    Apply the operations to all the input structures and report the
+    throughput.
+    '''
+    args = parse_cml_args(cml)
+    from ase.io import read
+
+    try:
+        outFs = output_names(args.poscar, args.out)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    t0 = time()
+    for poscar, outF in zip(args.poscar, outFs):
+        atoms = apply_pipeline(read(poscar, format='vasp'), args.ops,
+                               args.new_sym_order, args.sort_pos,
+                               args.layer_thickness,
+                               'xyz'.index(args.ivacuum))
+        write_poscar(outF, atoms, label=poscar_label(poscar))
+
+    t1 = time()
+    print("{} structures in {:.3f} [sec], {:.1f} structures/sec".format(
+        len(args.poscar), t1 - t0, len(args.poscar) / max(t1 - t0, 1E-9)))
+
+if __name__ == '__main__':
+    run_pipeline(sys.argv[1:])
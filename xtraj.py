@@ -1,49 +1,529 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import sys, argparse
+import os, io, sys, argparse
 import numpy as np
-from ase.io import read, write
+from ase import Atoms
+from ase.io import read, iread, write
+
+from vaspio import iter_xdatcar, write_formatted
+
+############################################################
+# The frames are formatted in memory and written to the file in blocks of at
+# least this number of characters.
+XTRAJ_BUFFER_SIZE = 4 * 1024**2
+
+# The number in the "ANIMSTEPS" line is patched in place at the end, it is
+# padded to this width when the number of frames is not known in advance.
+ANIMSTEPS_WIDTH = 10
+############################################################
+
+def format_axsf(snap, istep, out):
+    '''
+    Write the frame "snap", the "istep"-th one starting from 0, of the
+    Xcrysden axsf format to "out".
+    '''
+    if istep == 0:
+        out.write('PRIMVEC\n')
+        out.write(
+            '\n'.join([''.join(["%20.16f" % xx for xx in row])
+                                               for row in snap.cell])
+        )
+    out.write("\nPRIMCOORD {}\n".format(istep+1))
+    out.write("{} 1\n".format(len(snap)))
+    write_formatted(out, '%5d %22.16f %22.16f %22.16f\n',
+                    np.c_[snap.get_atomic_numbers(), snap.positions])
+
+def format_pdb(snap, istep, out):
+    '''
+    Write the frame "snap", the "istep"-th one starting from 0, of the PDB
+    format to "out".
+    '''
+    buf = io.StringIO()
+    write(buf, snap, format='proteindatabank')
+    # each frame is written as the first model by ASE
+    out.write(buf.getvalue().replace(
+        'MODEL     1\n', 'MODEL     {}\n'.format(istep+1), 1))
+
+def format_xyz(snap, istep, out):
+    '''
+    Write the frame "snap" of the (extended) xyz format to "out".
+    '''
+    write(out, snap, format='extxyz')
+
+FORMATTERS = {
+    'axsf': format_axsf,
+    'pdb' : format_pdb,
+    'xyz' : format_xyz,
+}
+
+def write_traj(trajs, ofile, fmt='axsf', nsteps=None,
+               bufsize=XTRAJ_BUFFER_SIZE):
+    '''
+    Write the frames "trajs", any iterable of Atoms, to "ofile" of the format
+    "fmt". The frames are formatted into a buffer of "bufsize" characters
+    before being written to the file, so that only one block of frames is
+    held in memory.
+
+    For the axsf format, the "ANIMSTEPS" line is written with "nsteps", or a
+    placeholder if unknown, and patched with the number of frames at the end.
+
+    Returns the number of frames.
+    '''
+    formatter = FORMATTERS[fmt]
+
+    nframes = 0
+    with open(ofile, 'w') as out:
+        if fmt == 'axsf':
+            if nsteps is None:
+                header = "ANIMSTEPS {:>%d}\n" % ANIMSTEPS_WIDTH
+            else:
+                header = "ANIMSTEPS {}\n"
+            out.write(header.format(nsteps or 0))
+            out.write("CRYSTAL\n")
+
+        buf = io.StringIO()
+        for snap in trajs:
+            formatter(snap, nframes, buf)
+            nframes += 1
+            if buf.tell() >= bufsize:
+                out.write(buf.getvalue())
+                buf.seek(0)
+                buf.truncate()
+        out.write(buf.getvalue())
+
+        if fmt == 'axsf' and nsteps is None:
+            out.seek(0)
+            out.write(header.format(nframes))
+
+    return nframes
 
 def ase2axsf(trajs, ofile='traj.axsf'):
     '''
     Save the trajectory to the Xcrysden variable-cell-axsf format.
     '''
-    nsteps = len(trajs)
+    nsteps = len(trajs) if hasattr(trajs, '__len__') else None
+    write_traj(trajs, ofile, 'axsf', nsteps)
+
+def iter_frames(arg):
+    '''
+    Iterate over the frames "start:stop:every" of the input file, or the
+    structure files of "-l", which are read in "-j" processes. XDATCAR is read
+    frame by frame, other files, e.g. OUTCAR, by "ase.io.iread".
+    '''
+    frames = slice(arg.start, arg.stop, arg.every)
 
-    with open(ofile, 'w+') as out:
-        out.write("ANIMSTEPS {}\nCRYSTAL\n".format(nsteps))
+    if arg.snaps:
+        snaps = arg.snaps[frames]
+        if arg.jobs == 1 or len(snaps) <= 1:
+            for f in snaps:
+                yield read(f)
+        else:
+            from multiprocessing import Pool, cpu_count
+            jobs = arg.jobs if arg.jobs > 0 else cpu_count()
+            pool = Pool(min(jobs, len(snaps)))
+            try:
+                # the frames are returned in the order of the files
+                for snap in pool.imap(read, snaps,
+                        chunksize=max(1, len(snaps) // (8 * jobs))):
+                    yield snap
+            finally:
+                pool.terminate()
+    elif 'XDATCAR' in os.path.basename(arg.inputFile).upper():
+        for cell, symbols, scaled in iter_xdatcar(arg.inputFile, arg.start,
+                                                  arg.stop, arg.every):
+            yield Atoms(symbols, cell=cell, scaled_positions=scaled,
+                        pbc=True)
+    else:
+        for snap in iread(arg.inputFile, index=frames):
+            yield snap
 
-        for ii in range(nsteps):
-            snap = trajs[ii]
-            natoms = snap.get_number_of_atoms()
+def iter_snapshots(arg):
+    '''
+    Iterate over the frames as "(cell, symbols, scaled_positions)", see
+    "iter_frames".
+    '''
+    if not arg.snaps and 'XDATCAR' in os.path.basename(arg.inputFile).upper():
+        for frame in iter_xdatcar(arg.inputFile, arg.start, arg.stop,
+                                  arg.every):
+            yield frame
+    else:
+        for snap in iter_frames(arg):
+            yield (np.array(snap.cell), snap.get_chemical_symbols(),
+                   snap.get_scaled_positions(wrap=False))
 
-            if ii == 0:
-                out.write('PRIMVEC\n')
-                out.write(
-                    '\n'.join([''.join(["%20.16f" % xx for xx in row])
-                                                       for row in snap.cell])
-        )
-            out.write("\nPRIMCOORD {}\n".format(ii+1))
-            out.write("{} 1\n".format(natoms))
-            np.savetxt(out, np.c_[snap.get_atomic_numbers(), snap.positions],
-                       fmt='%5d %22.16f %22.16f %22.16f'
-                    )
+############################################################
+# Analysis of the trajectory
+############################################################
+
+def rdf_pairs(species, pairs=None):
+    '''
+    The index of the species pairs "A-B" in "pairs", default to all the pairs
+    of "species" with A <= B, as a table of shape (nspecies, nspecies), -1
+    for the pairs not computed. Returns the table and the names of the pairs.
+    '''
+    if not pairs:
+        pairs = ['{}-{}'.format(species[ii], species[jj])
+                 for ii in range(len(species))
+                 for jj in range(ii, len(species))]
+
+    table = -np.ones((len(species), len(species)), dtype=int)
+    for ip, pair in enumerate(pairs):
+        a, b = pair.split('-')
+        if a not in species or b not in species:
+            raise ValueError('Unknown species in the pair "{}"!'.format(pair))
+        table[species.index(a), species.index(b)] = ip
+
+    return table, pairs
+
+def neighbor_pairs(cell, scaled, rmax):
+    '''
+    All the ordered pairs of atoms "(i, j)" closer than "rmax", including the
+    periodic images, of the atoms at the fractional coordinates "scaled" in
+    the cell "cell". Returns the indices "i", "j" and the distances.
+
+    The cell is divided into bins not thinner than "rmax" along each axis, so
+    that the neighbours of an atom are in the 27 bins around its own. The
+    atoms of each bin are gathered into a padded table, and the distances
+    between the atoms of all the bins and those of the neighbouring bins are
+    computed at once for each offset, only half of the offsets are needed as
+    the opposite ones find the same pairs. For cells thinner than three bins,
+    all the pairs between the periodic images are computed instead.
+    '''
+    import itertools
+
+    cell = np.asarray(cell, dtype=float)
+    s = scaled - np.floor(scaled)
+    pos = np.dot(s, cell)
+    natoms = s.shape[0]
+
+    # distance between the opposite faces of the cell
+    vol = abs(np.linalg.det(cell))
+    heights = vol / np.linalg.norm(
+        np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+    nb = np.floor(heights / rmax).astype(int)
+
+    pairs = []
+    if np.all(nb >= 3):
+        nbin = np.prod(nb)
+        ib = np.minimum((s * nb).astype(int), nb - 1)
+        flat = np.ravel_multi_index(ib.T, nb)
+        order = np.argsort(flat, kind='stable')
+        counts = np.bincount(flat, minlength=nbin)
+        slot = np.arange(natoms) - np.r_[0, np.cumsum(counts)[:-1]][flat[order]]
+        table = -np.ones((nbin, counts.max()), dtype=int)
+        table[flat[order], slot] = order
+
+        bins = np.array(np.unravel_index(np.arange(nbin), nb)).T
+        # the empty slots of the table are never closer than rmax
+        padded = np.r_[pos, [[np.nan] * 3]]
+        # the pairs of the opposite offsets are the same ones, reversed
+        offsets = list(itertools.product([-1, 0, 1], repeat=3))[13:]
+        for offset in offsets:
+            other = bins + offset
+            shift = np.floor_divide(other, nb)
+            other = table[np.ravel_multi_index((other - shift * nb).T, nb)]
+            dd = padded[other][:, np.newaxis] - padded[table][:, :, np.newaxis] \
+                + np.dot(shift, cell)[:, np.newaxis, np.newaxis]
+            dd = np.einsum('...i,...i', dd, dd)
+            keep = dd < rmax**2
+            if offset == (0, 0, 0):
+                # each pair once, without the atom itself
+                keep &= np.triu(np.ones(keep.shape[1:], dtype=bool), 1)
+            ii, jj, kk = np.nonzero(keep)
+            dd = np.sqrt(dd[ii, jj, kk])
+            ii, jj = table[ii, jj], other[ii, kk]
+            pairs.append((np.r_[ii, jj], np.r_[jj, ii], np.r_[dd, dd]))
+    else:
+        nimg = np.ceil(rmax / heights).astype(int)
+        for shift in itertools.product(*[range(-n, n + 1) for n in nimg]):
+            dd = np.linalg.norm(pos[np.newaxis] - pos[:, np.newaxis] +
+                                np.dot(shift, cell), axis=-1)
+            keep = dd < rmax
+            if not any(shift):
+                np.fill_diagonal(keep, False)
+            ii, jj = np.nonzero(keep)
+            pairs.append((ii, jj, dd[ii, jj]))
+
+    return [np.concatenate(x) for x in zip(*pairs)]
+
+def rdf_histogram(frames, types, table, rmax, nbins):
+    '''
+    Histogram of the distances of the atom pairs within "rmax" in the
+    "frames" of "(cell, scaled_positions)", in "nbins" bins for each pair of
+    "table". The periodic neighbours are found by the cell lists of
+    "neighbor_pairs", so that the cost scales linearly with the number of
+    atoms, also for variable and triclinic cells.
+
+    Returns the histogram of shape (npairs, nbins) and the sum of the
+    normalizations "N_A (N_B - delta_AB) / V" over the frames for each pair.
+    '''
+    npairs = table.max() + 1
+    counts = np.bincount(types, minlength=table.shape[0])
+    dr = rmax / nbins
+
+    hist = np.zeros(npairs * nbins, dtype=float)
+    norm = np.zeros(npairs, dtype=float)
+    pair_i, pair_j = np.nonzero(table >= 0)
+    for cell, scaled in frames:
+        ii, jj, dd = neighbor_pairs(cell, scaled, rmax)
+        ip = table[types[ii], types[jj]]
+        kept = ip >= 0
+        ibin = np.minimum((dd[kept] / dr).astype(int), nbins - 1)
+        hist += np.bincount(ip[kept] * nbins + ibin,
+                            minlength=npairs * nbins)
+
+        vol = abs(np.linalg.det(cell))
+        norm[table[pair_i, pair_j]] += counts[pair_i] * (
+            counts[pair_j] - (pair_i == pair_j)) / vol
+
+    return hist.reshape((npairs, nbins)), norm
+
+def _rdf_task(args):
+    return rdf_histogram(*args)
+
+def time_correlation(x, y=None):
+    '''
+    The time correlation "<x(t0) . y(t0 + t)>" averaged over "t0", of the
+    series "x" of shape (nsteps, natoms, 3), for each atom. The correlation is
+    computed by FFT with zero padding, in O(T log T) instead of O(T^2).
+
+    Returns the correlation of shape (nsteps, natoms).
+    '''
+    nsteps = x.shape[0]
+    nfft = 2 * nsteps
+    fx = np.fft.rfft(x, nfft, axis=0)
+    fy = fx if y is None else np.fft.rfft(y, nfft, axis=0)
+    corr = np.fft.irfft(fx.conj() * fy, nfft, axis=0)[:nsteps].sum(axis=-1)
+
+    return corr / (nsteps - np.arange(nsteps))[:, np.newaxis]
+
+def mean_square_displacement(r):
+    '''
+    The MSD "<|r(t0 + t) - r(t0)|^2>" averaged over "t0" of the unwrapped
+    positions "r" of shape (nsteps, natoms, 3) for each atom, from
+
+        MSD(t) = <r^2(t0 + t)> + <r^2(t0)> - 2 <r(t0) . r(t0 + t)>
+
+    where the last term is evaluated by "time_correlation".
+
+    Returns the MSD of shape (nsteps, natoms).
+    '''
+    nsteps = r.shape[0]
+    r2 = np.sum(r**2, axis=-1)
+    csum = np.r_[np.zeros((1, r.shape[1])), np.cumsum(r2, axis=0)]
+    lag = np.arange(nsteps)
+    s1 = (csum[nsteps - lag] + csum[nsteps] - csum[lag]) / \
+        (nsteps - lag)[:, np.newaxis]
+
+    return s1 - 2 * time_correlation(r)
+
+def _dynamics_task(args):
+    '''
+    The MSD and VACF of the atoms "start:stop" of the unwrapped positions
+    saved in "fname", summed over the atoms of each species.
+    '''
+    fname, shape, types, nspecies, start, stop, dt, quantities = args
+    r = np.memmap(fname, dtype=float, mode='r', shape=shape)
+    r = np.array(r[:, start:stop])
+    tt = types[start:stop]
+
+    def species_sum(x):
+        out = np.zeros((nspecies, x.shape[0]))
+        for ii in range(nspecies):
+            out[ii] = x[:, tt == ii].sum(axis=1)
+        return out
+
+    results = {}
+    if 'msd' in quantities:
+        results['msd'] = species_sum(mean_square_displacement(r))
+    if 'vacf' in quantities and shape[0] > 1:
+        v = np.diff(r, axis=0) / dt
+        results['vacf'] = species_sum(time_correlation(v))
+
+    return results
+
+def _imap_bounded(pool, func, tasks, nmax):
+    '''
+    Map "func" over the iterable "tasks" in order, with at most "nmax" tasks
+    submitted to the pool at once, so that a streamed input is not read ahead
+    into memory. Tasks are run in this process if "pool" is None.
+    '''
+    from collections import deque
+
+    pending = deque()
+    for task in tasks:
+        if pool is None:
+            yield func(task)
+            continue
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= nmax:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _chunks(iterable, n):
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) == n:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def analyze(arg):
+    '''
+    Compute the RDF, MSD and/or VACF of the trajectory in one pass over the
+    frames, which are not kept in memory.
+
+    The RDF of the chunks of "--chunk" frames are computed in "-j" processes.
+    For MSD and VACF, the positions are unwrapped from the changes of the
+    fractional coordinates between consecutive frames, using the cell of each
+    frame, and saved to a file in the temporary directory, from which the
+    time correlations of blocks of atoms are computed in parallel. The
+    velocities of VACF are the finite differences of the unwrapped positions.
+    '''
+    import shutil, tempfile, itertools
+    from multiprocessing import Pool, cpu_count
+
+    quantities = arg.analysis
+    dynamics = [q for q in quantities if q in ['msd', 'vacf']]
+    # time between the analyzed frames in fs
+    dt = arg.dt * arg.every
+
+    frames = iter_snapshots(arg)
+    try:
+        first = next(frames)
+    except StopIteration:
+        raise ValueError('No frame is read from the input!')
+    frames = itertools.chain([first], frames)
+    symbols = first[1]
+    species = sorted(set(symbols), key=symbols.index)
+    types = np.array([species.index(x) for x in symbols])
+    table, pairs = rdf_pairs(species, arg.pairs)
+
+    jobs = arg.jobs if arg.jobs > 0 else cpu_count()
+    pool = Pool(jobs) if jobs > 1 else None
+    tmpdir = tempfile.mkdtemp(prefix='xtraj-')
+    fname = os.path.join(tmpdir, 'positions.bin')
+    try:
+        nframes = [0]
+
+        def tasks(out):
+            '''
+            Save the unwrapped positions to "out" and group the frames into
+            the RDF tasks.
+            '''
+            last = unwrapped = None
+            for chunk in _chunks(frames, arg.chunk):
+                nframes[0] += len(chunk)
+                for cell, symbols, scaled in chunk:
+                    if scaled.shape != (types.size, 3):
+                        raise ValueError('The number of atoms changes in the trajectory!')
+                    if not dynamics:
+                        continue
+                    if last is None:
+                        unwrapped = np.dot(scaled, cell)
+                    else:
+                        ds = scaled - last
+                        ds -= np.round(ds)
+                        unwrapped += np.dot(ds, cell)
+                    last = scaled
+                    out.write(unwrapped.tobytes())
+                yield ([(cell, scaled) for cell, symbols, scaled in chunk],
+                       types, table, arg.rmax, arg.nbins)
+
+        hist = np.zeros((len(pairs), arg.nbins))
+        norm = np.zeros(len(pairs))
+        with open(fname, 'wb') as out:
+            if 'rdf' in quantities:
+                for h, n in _imap_bounded(pool, _rdf_task, tasks(out),
+                                          2 * jobs):
+                    hist += h
+                    norm += n
+            else:
+                for task in tasks(out):
+                    pass
+        nframes = nframes[0]
+        print('{} frames of {} atoms analyzed.'.format(nframes, types.size))
+
+        if 'rdf' in quantities:
+            r = (np.arange(arg.nbins) + 0.5) * arg.rmax / arg.nbins
+            edges = np.arange(arg.nbins + 1) * arg.rmax / arg.nbins
+            shell = 4. / 3. * np.pi * np.diff(edges**3)
+            gr = hist / (np.where(norm > 0, norm, 1.0)[:, np.newaxis] * shell)
+            save_columns('{}_rdf.dat'.format(arg.outPrefix),
+                         ['r(A)'] + pairs, np.c_[r, gr.T])
+
+        if dynamics:
+            natoms = types.size
+            shape = (nframes, natoms, 3)
+            # the atoms are split into blocks of about 16 MB of positions, the
+            # FFTs of a block take a few times more
+            nblock = max(1, min(natoms, int(2 * 1024**2 // (nframes * 3))))
+            blocks = [
+                (fname, shape, types, len(species), start,
+                 min(start + nblock, natoms), dt, dynamics)
+                for start in range(0, natoms, nblock)
+            ]
+            results = pool.map(_dynamics_task, blocks) if pool else \
+                [_dynamics_task(block) for block in blocks]
+            counts = np.bincount(types, minlength=len(species))[:, np.newaxis]
+
+            if 'msd' in quantities:
+                msd = np.sum([x['msd'] for x in results], axis=0) / counts
+                t = np.arange(nframes) * dt
+                save_columns('{}_msd.dat'.format(arg.outPrefix),
+                             ['t(fs)'] + species, np.c_[t, msd.T])
+                diffusion_report(t, msd, species, arg.fit)
+            if 'vacf' in quantities and nframes > 1:
+                vacf = np.sum([x['vacf'] for x in results], axis=0) / counts
+                t = np.arange(nframes - 1) * dt
+                save_columns('{}_vacf.dat'.format(arg.outPrefix),
+                             ['t(fs)'] + species, np.c_[t, vacf.T])
+    finally:
+        if pool is not None:
+            pool.terminate()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def save_columns(fname, names, data):
+    '''
+    Save the columns "data" with the header "names" to the text file "fname".
+    '''
+    with open(fname, 'w') as out:
+        out.write('#' + ''.join(['%15s' % x for x in names]) + '\n')
+        write_formatted(out, ' ' + ' '.join(['%14.6f'] * len(names)) + '\n',
+                        data)
+
+def diffusion_report(t, msd, species, fit=(0.1, 0.5)):
+    '''
+    Print the diffusion coefficient "D = MSD / 6t" of each species from the
+    linear fit of MSD within the fraction "fit" of the time range.
+    '''
+    lo, hi = [int(round(x * (t.size - 1))) for x in fit]
+    if hi - lo < 2:
+        return
+    for ii, name in enumerate(species):
+        slope = np.polyfit(t[lo:hi+1], msd[ii, lo:hi+1], 1)[0]
+        # 1 A^2/fs = 0.1 cm^2/s
+        print('D({:>2s}) = {:.4e} cm^2/s'.format(name, slope / 6 * 0.1))
 
 def xdatcar2traj(cml):
     arg = parse_cml_args(cml)
 
-    if arg.snaps:
-        trajs = [read(f) for f in arg.snaps]
-    else:
-        trajs = read(arg.inputFile, index=':')
+    if arg.analysis:
+        analyze(arg)
+        return
 
-    if arg.outFmt == 'xyz':
-        write('{}.xyz'.format(arg.outPrefix), trajs)
-    elif arg.outFmt == 'pdb':
-        write('{}.pdb'.format(arg.outPrefix), trajs)
-    else:
-        ase2axsf(trajs, ofile='{}.axsf'.format(arg.outPrefix))
+    # the number of frames is only known for the list of files
+    nsteps = len(arg.snaps[arg.start:arg.stop:arg.every]) \
+        if arg.snaps else None
+    nframes = write_traj(iter_frames(arg),
+                         '{}.{}'.format(arg.outPrefix, arg.outFmt),
+                         arg.outFmt, nsteps)
+    if nframes == 0:
+        raise ValueError('No frame is read from the input!')
 
 def parse_cml_args(cml):
     '''
@@ -63,6 +543,39 @@ def parse_cml_args(cml):
     arg.add_argument('-l', dest='snaps', action='store', type=str,
                      default=[], nargs='+',
                      help='List of structure files.')
+    arg.add_argument('--start', dest='start', action='store', type=int,
+                     default=0,
+                     help='The first frame, starting from 0.')
+    arg.add_argument('--stop', dest='stop', action='store', type=int,
+                     default=None,
+                     help='Stop before this frame, default to the last one.')
+    arg.add_argument('--every', dest='every', action='store', type=int,
+                     default=1,
+                     help='Only write every N-th frame.')
+    arg.add_argument('-j', dest='jobs', action='store', type=int,
+                     default=1,
+                     help='Number of processes to read the files of "-l", or to analyze the trajectory, 0 for all the CPUs.')
+    arg.add_argument('-a', dest='analysis', action='store', type=str,
+                     default=[], nargs='+', choices=['rdf', 'msd', 'vacf'],
+                     help='Analyze the trajectory instead of converting it, the results are saved to "PREFIX_rdf.dat", etc.')
+    arg.add_argument('--rmax', dest='rmax', action='store', type=float,
+                     default=6.0,
+                     help='The cutoff of the RDF in Angstrom.')
+    arg.add_argument('--nbins', dest='nbins', action='store', type=int,
+                     default=300,
+                     help='The number of bins of the RDF.')
+    arg.add_argument('--pairs', dest='pairs', action='store', type=str,
+                     default=[], nargs='+',
+                     help='The species pairs of the RDF, e.g. "Si-O O-O", default to all of them.')
+    arg.add_argument('--dt', dest='dt', action='store', type=float,
+                     default=1.0,
+                     help='The time between the frames of the input in fs, i.e. POTIM * NBLOCK for XDATCAR.')
+    arg.add_argument('--fit', dest='fit', action='store', type=float,
+                     default=(0.1, 0.5), nargs=2,
+                     help='The fraction of the time range where the MSD is fitted for the diffusion coefficients.')
+    arg.add_argument('--chunk', dest='chunk', action='store', type=int,
+                     default=100,
+                     help='The number of frames of the RDF computed by each task.')
 
     return arg.parse_args(cml)
 